@@ -7,11 +7,12 @@ import itertools
 
 import streamlit as st
 from dotenv import load_dotenv
-import openai
+
+from llm_client import stream_completion
+from streaming import ConcurrentStreams, RenderScheduler, ResponseBuffer
 
 # Load env vars, especially OPENAI_API_KEY
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 st.set_page_config(page_title="LLM Arena – Side-by-Side", layout="wide")
 
@@ -33,6 +34,14 @@ SYSTEM_PROMPTS: List[Dict[str, str]] = [
 
 TEMPERATURE = 0.7
 MAX_TOKENS = 512
+# Seconds a side may take before it is cut off; the other side keeps going
+SIDE_TIMEOUT = 90.0
+
+STATUS_NOTES = {
+    "cancelled": "⏹️ Stopped",
+    "timeout": f"⏱️ Timed out after {SIDE_TIMEOUT:.0f}s",
+    "error": "❌ No response from this model, try generating again",
+}
 
 DATA_DIR = "data"
 VOTE_LOG = os.path.join(DATA_DIR, "votes.csv")
@@ -42,22 +51,35 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # -----------------------------------------------------------------------------
 
 
-def generate_response(model: str, system_prompt: str, user_prompt: str) -> str:
-    """Query the OpenAI chat completion endpoint and return the assistant message."""
+def stream_response(model: str, system_prompt: str, user_prompt: str):
+    """Stream the assistant message from the OpenAI chat completion endpoint.
+
+    Errors raise (see llm_client.stream_completion) and show up as the
+    side's "error" status rather than as text in the response. Leading
+    whitespace is dropped here; trailing whitespace once the reply is
+    complete (ResponseBuffer.strip).
+    """
+    stream = stream_completion(
+        model,
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+    )
     try:
-        resp = openai.chat.completions.create(
-            model=model,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        # Catch any error from the OpenAI SDK (or others) and surface it gracefully.
-        return f"❌ Error from {model}: {e}"
+        started = False
+        for chunk in stream:
+            if not started:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                started = True
+            yield chunk
+    finally:
+        # Release the HTTP response when the side is stopped
+        stream.close()
 
 
 def log_vote(prompt: str, left_id: str, right_id: str, choice: str) -> None:
@@ -121,25 +143,54 @@ if generate_btn:
         "system": right_sys["system"],
     }
 
-    with st.spinner("Generating responses…"):
-        left_resp = generate_response(cfg_left["model"], cfg_left["system"], user_prompt)
-        right_resp = generate_response(cfg_right["model"], cfg_right["system"], user_prompt)
-
+    # Both sides stream at once. The streams object lives in session state
+    # so that a Stop click (which reruns the script) cancels just that side
+    # and the next run picks the other side up where it left off.
+    if (previous := st.session_state.get("duel")) and not previous["streams"].done:
+        for side in ("left", "right"):
+            previous["streams"].cancel(side)
     st.session_state["duel"] = {
         "prompt": user_prompt,
-        "left": {"cfg": cfg_left, "resp": left_resp},
-        "right": {"cfg": cfg_right, "resp": right_resp},
+        "left": {"cfg": cfg_left, "resp": ResponseBuffer()},
+        "right": {"cfg": cfg_right, "resp": ResponseBuffer()},
+        "streams": ConcurrentStreams(
+            {
+                "left": stream_response(cfg_left["model"], cfg_left["system"], user_prompt),
+                "right": stream_response(cfg_right["model"], cfg_right["system"], user_prompt),
+            },
+            timeout=SIDE_TIMEOUT,
+            cancel_on_exit=False,
+            raise_errors=False,
+        ),
     }
 
 # Existing duel in session?
 if duel := st.session_state.get("duel"):
+    streams = duel["streams"]
     cols = st.columns(2)
-    with cols[0]:
-        st.subheader("Left Response")
-        st.markdown(duel["left"]["resp"])
-    with cols[1]:
-        st.subheader("Right Response")
-        st.markdown(duel["right"]["resp"])
+    placeholders = {}
+    for col, side, title in ((cols[0], "left", "Left Response"), (cols[1], "right", "Right Response")):
+        with col:
+            st.subheader(title)
+            if not streams.done and streams.status.get(side, "running") == "running":
+                if st.button("⏹️ Stop", key=f"stop_{side}"):
+                    streams.cancel(side)
+            placeholders[side] = st.empty()
+            placeholders[side].markdown(str(duel[side]["resp"]))
+            if note := STATUS_NOTES.get(streams.status.get(side)):
+                st.caption(note)
+
+    if not streams.done:
+        renderers = {side: RenderScheduler(placeholders[side]) for side in ("left", "right")}
+        for side, tok in streams:
+            if tok is None:
+                duel[side]["resp"].strip()
+                renderers[side].finish(duel[side]["resp"])
+            else:
+                duel[side]["resp"].append(tok)
+                renderers[side].update(duel[side]["resp"])
+        # Redraw without the Stop buttons
+        st.rerun()
 
     st.markdown("---")
     st.write("### Which response do you prefer?")
@@ -0,0 +1,868 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+import atexit
+import logging
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from datetime import datetime
+from typing import List, Dict, Optional, Iterator, Tuple
+
+from prompts import FRAGMENTS
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+DB_PATH = os.getenv("NISA_ARENA_DB", "nisa_arena.db")
+
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every new connection. WAL lets readers proceed while a vote is
+# being written; synchronous=NORMAL is durable across app crashes in WAL mode
+# and only skips the fsync per commit.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "cache_size": -16000,  # negative = KiB, so ~16 MB page cache
+    "temp_store": "MEMORY",
+}
+
+logger = logging.getLogger(__name__)
+
+# Default system prompts if database doesn't exist
+DEFAULT_PROMPTS = [
+    {
+        "id": "helpful_assistant",
+        "name": "!Saved Prompts Didn't Load",
+        "prompt": "You are a helpful, harmless, and honest AI assistant."
+    },
+]
+
+# -----------------------------------------------------------------------------
+# Connection pool
+# -----------------------------------------------------------------------------
+
+class ConnectionPool:
+    """Hands out one SQLite connection per thread, reusing those of dead threads.
+
+    A thread keeps its connection for as long as it lives, so a connection
+    never needs locking on our side. Streamlit runs every rerun on a fresh
+    ScriptRunner thread, though, so threads are short-lived: a new thread
+    takes over the connection of one that has exited (opening only when
+    none is free), and any other connections left by exited threads are
+    closed at that point.
+    """
+
+    def __init__(self, path: str = DB_PATH, pragmas: Optional[Dict] = None, read_only: bool = False):
+        self.path = path
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self.read_only = read_only
+        if read_only:
+            # Switching to WAL writes the file header
+            self.pragmas.pop("journal_mode", None)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: Dict[int, tuple] = {}
+        self.schema_ready = False
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+        conn = sqlite3.connect(
+            f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro" if self.read_only else self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            uri=self.read_only,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        thread = threading.current_thread()
+        with self._lock:
+            conn = self._take_dead_thread_connection()
+            self._connections[thread.ident] = (thread, conn)
+        self._local.conn = conn
+        return conn
+
+    def _take_dead_thread_connection(self) -> sqlite3.Connection:
+        """Hand over one exited thread's connection and close the rest (or open one)."""
+        reused = None
+        for ident, (thread, conn) in list(self._connections.items()):
+            if thread.is_alive():
+                continue
+            del self._connections[ident]
+            if reused is None and not conn.in_transaction:
+                reused = conn
+            else:
+                conn.close()
+        return reused if reused is not None else self._open()
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Run a block inside a single transaction, rolling back on error.
+
+        Use immediate=True for writes so the write lock is taken up front
+        instead of failing half-way through on a lock upgrade. Nested calls
+        join the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def close_all(self) -> None:
+        """Close every connection handed out by this pool."""
+        with self._lock:
+            for _, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, shared by every Streamlit session."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def set_db_path(path: str, read_only: bool = False) -> ConnectionPool:
+    """Point the process-wide pool at a different database file.
+
+    A read-only pool opens the file with mode=ro, so nothing (including
+    init_db) can change it.
+    """
+    global _pool, DB_PATH
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        DB_PATH = path
+        _pool = ConnectionPool(path, read_only=read_only)
+    return _pool
+
+
+def connection() -> sqlite3.Connection:
+    """Shortcut for the current thread's pooled connection."""
+    return get_pool().connection()
+
+
+def transaction(immediate: bool = False):
+    """Shortcut for a transaction on the process-wide pool."""
+    return get_pool().transaction(immediate=immediate)
+
+
+@atexit.register
+def _close_pool() -> None:
+    if _pool is not None:
+        _pool.close_all()
+
+# -----------------------------------------------------------------------------
+# Database Functions
+# -----------------------------------------------------------------------------
+
+def init_db():
+    """Initialize the SQLite database with required tables."""
+    pool = get_pool()
+    if pool.schema_ready:
+        return
+
+    with pool.transaction(immediate=True) as conn:
+        create_fragment_tables(conn)
+        seed_fragment_library(conn)
+
+        # Votes used to be one row of JSON blobs each; move that table aside
+        # so the normalized tables can take its name. Rows are copied over
+        # in batches by migrate_legacy_votes(), on a background thread.
+        vote_columns = [column[1] for column in conn.execute("PRAGMA table_info(votes)")]
+        if 'conversation' in vote_columns:
+            conn.execute('ALTER TABLE votes RENAME TO votes_legacy')
+            # New vote ids continue after the legacy ones
+            conn.execute("""
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT 'votes', COALESCE(MAX(id), 0) FROM votes_legacy
+            """)
+
+        create_vote_tables(conn)
+        create_leaderboard_tables(conn)
+        migrate_prompt_version_text(conn)
+
+        # Each prompt points at its current version in prompt_versions
+        create_prompts_table(conn)
+        migrate_prompt_text(conn)
+        backfill_prompt_version_times(conn)
+        create_eval_tables(conn)
+
+        # Small key/value table for counters such as the prompts version
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+
+        legacy = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'votes_legacy'"
+        ).fetchone()
+
+    pool.schema_ready = True
+    if legacy:
+        # The app serves (and records votes) meanwhile; the leaderboard
+        # waits for the table to be gone before reading votes
+        threading.Thread(target=_migrate_legacy_votes_logged, name="legacy-vote-migration", daemon=True).start()
+
+def _load_prompt_rows(conn: sqlite3.Connection) -> List[Dict[str, str]]:
+    rows = conn.execute('''
+        SELECT p.id, p.name, v.recipe, p.version, p.active
+        FROM prompts p JOIN prompt_versions v ON v.prompt_id = p.id AND v.version = p.version
+    ''').fetchall()
+    return [
+        {'id': row[0], 'name': row[1], 'prompt': assemble_prompt(conn, row[2]), 'version': row[3],
+         'active': bool(row[4])}
+        for row in rows
+    ]
+
+def load_system_prompts() -> List[Dict[str, str]]:
+    """Load system prompts from database, creating default if doesn't exist.
+
+    A plain read; the write lock is only taken to seed an empty table.
+    """
+    with transaction() as conn:
+        if conn.execute('SELECT COUNT(*) FROM prompts').fetchone()[0]:
+            return _load_prompt_rows(conn)
+
+    with transaction(immediate=True) as conn:
+        # Another process may have seeded (or saved) in the meantime
+        if conn.execute('SELECT COUNT(*) FROM prompts').fetchone()[0]:
+            return _load_prompt_rows(conn)
+
+        # Insert default prompts
+        conn.executemany('INSERT INTO prompts (id, name, version, active) VALUES (?, ?, ?, 1)',
+                         [(p['id'], p['name'], record_prompt_version(conn, p['id'], p['name'], p['prompt']))
+                          for p in DEFAULT_PROMPTS])
+        return [dict(prompt, version=prompt_hash(prompt['prompt']), active=True) for prompt in DEFAULT_PROMPTS]
+
+def load_active_prompts() -> List[Dict[str, str]]:
+    """Load only active system prompts from database."""
+    return _load_active_prompts(connection())
+
+def _load_active_prompts(conn: sqlite3.Connection) -> List[Dict[str, str]]:
+    rows = conn.execute('''
+        SELECT p.id, p.name, v.recipe, p.version
+        FROM prompts p JOIN prompt_versions v ON v.prompt_id = p.id AND v.version = p.version
+        WHERE p.active = 1
+    ''').fetchall()
+    return [{'id': row[0], 'name': row[1], 'prompt': assemble_prompt(conn, row[2]), 'version': row[3]} for row in rows]
+
+def read_active_prompts(path: str) -> List[Dict[str, str]]:
+    """Active prompts of another database file, leaving that file untouched.
+
+    The file is copied into memory and only its prompt tables migrated
+    there, so any schema version init_db would accept can be read.
+    """
+    source = sqlite3.connect(f'file:{pathname2url(os.path.abspath(path))}?mode=ro', uri=True)
+    conn = sqlite3.connect(':memory:')
+    try:
+        source.backup(conn)
+        with conn:
+            create_fragment_tables(conn)
+            seed_fragment_library(conn)
+            create_prompt_versions_table(conn)
+            migrate_prompt_version_text(conn)
+            create_prompts_table(conn)
+            migrate_prompt_text(conn)
+        return _load_active_prompts(conn)
+    finally:
+        source.close()
+        conn.close()
+
+def get_prompts_version() -> int:
+    """Return the counter bumped by every save_system_prompts commit."""
+    row = connection().execute("SELECT value FROM meta WHERE key = 'prompts_version'").fetchone()
+    return row[0] if row else 0
+
+def diff_prompts(stored: Dict[str, tuple], prompts: List[Dict[str, str]]) -> Dict[str, list]:
+    """Work out the minimal set of row changes to turn `stored` into `prompts`.
+
+    `stored` maps id -> (name, version, active), where version is the
+    prompt text's hash, so unchanged text is spotted without assembling it.
+    Returns parameter lists for the upsert, active-flag update and delete
+    statements; upserts carry the prompt text.
+    """
+    upserts, toggles, seen = [], [], set()
+    for prompt in prompts:
+        pid = prompt['id']
+        if pid in seen:
+            raise sqlite3.IntegrityError("UNIQUE constraint failed: prompts.id")
+        seen.add(pid)
+
+        active = int(prompt.get('active', True))  # Default to active if not specified
+        current = stored.get(pid)
+        if current is None or current[0] != prompt['name'] or current[1] != prompt_hash(prompt['prompt']):
+            upserts.append((pid, prompt['name'], prompt['prompt'], active))
+        elif current[2] != active:
+            toggles.append((active, pid))
+
+    deletes = [(pid,) for pid in stored if pid not in seen]
+    return {'upserts': upserts, 'toggles': toggles, 'deletes': deletes}
+
+def save_system_prompts(prompts: List[Dict[str, str]]) -> int:
+    """Save system prompts to database and return the prompts version.
+
+    Only rows that actually differ from the stored state are written, so
+    flipping one prompt's active flag updates a single row. The version is
+    only bumped when something changed. Edited text never overwrites the
+    old: it is appended to prompt_versions and the prompt repointed at it.
+    """
+    with transaction(immediate=True) as conn:
+        stored = {
+            row[0]: (row[1], row[2], row[3])
+            for row in conn.execute('SELECT id, name, version, active FROM prompts')
+        }
+        changes = diff_prompts(stored, prompts)
+
+        if changes['deletes']:
+            conn.executemany('DELETE FROM prompts WHERE id = ?', changes['deletes'])
+        if changes['upserts']:
+            conn.executemany('''
+                INSERT INTO prompts (id, name, version, active) VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    name = excluded.name, version = excluded.version, active = excluded.active
+            ''', [(pid, name, record_prompt_version(conn, pid, name, text), active)
+                  for pid, name, text, active in changes['upserts']])
+        if changes['toggles']:
+            conn.executemany('UPDATE prompts SET active = ? WHERE id = ?', changes['toggles'])
+
+        if any(changes.values()):
+            conn.execute('''
+                INSERT INTO meta (key, value) VALUES ('prompts_version', 1)
+                ON CONFLICT(key) DO UPDATE SET value = value + 1
+            ''')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'prompts_version'").fetchone()
+        return row[0] if row else 0
+
+def save_vote(conversation: List[Dict], left_config: Dict, right_config: Dict, winner: str) -> int:
+    """Save voting data to database and return the vote id."""
+    with transaction(immediate=True) as conn:
+        return insert_vote(conn, conversation, left_config, right_config, winner,
+                           datetime.utcnow().isoformat())
+
+# -----------------------------------------------------------------------------
+# Prompt fragments
+# -----------------------------------------------------------------------------
+# Prompt text is stored once per distinct fragment, keyed by its SHA-256.
+# A prompt (and each prompt version) is a recipe: a JSON list of fragment
+# hashes that concatenate to its text. Text saved from the settings panel
+# is split on the named fragments in the library (seeded from prompts.py)
+# and the rest at markdown headings, so variants pasted in by hand share
+# the rows of every section they have in common.
+
+# Sections start at a line beginning with '#'
+SECTION_BREAK = re.compile(r'(?=\n#)')
+
+def create_fragment_tables(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fragments (
+            hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fragment_library (
+            name TEXT PRIMARY KEY,
+            hash TEXT NOT NULL REFERENCES fragments (hash)
+        )
+    ''')
+
+# Fragments never change once stored, so this cache is never stale
+_fragment_texts: Dict[str, str] = {}
+
+def put_fragments(conn: sqlite3.Connection, texts: List[str]) -> List[str]:
+    """Store fragment texts (once each) and return their hashes."""
+    hashes = [prompt_hash(text) for text in texts]
+    conn.executemany('INSERT OR IGNORE INTO fragments (hash, text) VALUES (?, ?)', zip(hashes, texts))
+    return hashes
+
+def seed_fragment_library(conn: sqlite3.Connection, fragments: Dict[str, str] = FRAGMENTS) -> None:
+    """Point the library's names at the current text of prompts.FRAGMENTS."""
+    names = list(fragments)
+    hashes = put_fragments(conn, [fragments[name] for name in names])
+    conn.executemany('''
+        INSERT INTO fragment_library (name, hash) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET hash = excluded.hash
+    ''', list(zip(names, hashes)))
+
+def load_fragment_library(conn: Optional[sqlite3.Connection] = None) -> Dict[str, str]:
+    """Named fragments, name -> text."""
+    conn = conn or connection()
+    rows = conn.execute('''
+        SELECT l.name, f.text FROM fragment_library l JOIN fragments f ON f.hash = l.hash ORDER BY l.name
+    ''')
+    return dict(rows.fetchall())
+
+def split_prompt(text: str, library: List[str]) -> List[str]:
+    """Cut text into pieces that reuse library fragments wherever they occur.
+
+    Scans left to right for the earliest (then longest) library fragment;
+    text between matches is cut into markdown sections. The pieces always
+    join back to exactly `text`.
+    """
+    library = [fragment for fragment in library if fragment]
+    pieces = []
+    i = 0
+    while i < len(text):
+        best = None
+        for fragment in library:
+            j = text.find(fragment, i)
+            if j != -1 and (best is None or j < best[0] or (j == best[0] and len(fragment) > len(best[1]))):
+                best = (j, fragment)
+        end = len(text) if best is None else best[0]
+        pieces.extend(piece for piece in SECTION_BREAK.split(text[i:end]) if piece)
+        if best is None:
+            break
+        pieces.append(best[1])
+        i = end + len(best[1])
+    return pieces
+
+def store_prompt_text(conn: sqlite3.Connection, text: str) -> Tuple[str, str]:
+    """Store a prompt's text as fragments; returns (recipe JSON, version hash)."""
+    library = list(load_fragment_library(conn).values())
+    recipe = put_fragments(conn, split_prompt(text, library))
+    return json.dumps(recipe), prompt_hash(text)
+
+def assemble_prompt(conn: sqlite3.Connection, recipe: str) -> str:
+    """Prompt text for a recipe, reading only fragments not already cached."""
+    hashes = json.loads(recipe)
+    missing = [h for h in set(hashes) if h not in _fragment_texts]
+    if missing:
+        placeholders = ','.join('?' * len(missing))
+        for h, text in conn.execute(f'SELECT hash, text FROM fragments WHERE hash IN ({placeholders})', missing):
+            _fragment_texts[h] = text
+    return ''.join(_fragment_texts[h] for h in hashes)
+
+def migrate_prompt_text(conn: sqlite3.Connection) -> None:
+    """Rebuild a prompts table that still holds its own text or recipe.
+
+    Each prompt's text becomes a prompt_versions row and the prompt keeps
+    only a pointer to it.
+    """
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(prompts)")]
+    if 'prompt' in columns:
+        active = 'active' if 'active' in columns else '1'
+        rows = [
+            (pid, name, *store_prompt_text(conn, text), flag)
+            for pid, name, text, flag in conn.execute(f'SELECT id, name, prompt, {active} FROM prompts').fetchall()
+        ]
+    elif 'recipe' in columns:
+        rows = conn.execute('SELECT id, name, recipe, version, active FROM prompts').fetchall()
+    else:
+        return
+    conn.executemany(
+        'INSERT OR IGNORE INTO prompt_versions (prompt_id, version, name, recipe, created_at) VALUES (?, ?, ?, ?, ?)',
+        [(pid, version, name, recipe, datetime.utcnow().isoformat()) for pid, name, recipe, version, _ in rows]
+    )
+    # Dropped and recreated rather than renamed: a rename would also
+    # repoint other tables' foreign keys at the old copy
+    conn.execute('DROP TABLE prompts')
+    create_prompts_table(conn)
+    conn.executemany('INSERT INTO prompts (id, name, version, active) VALUES (?, ?, ?, ?)',
+                     [(pid, name, version, flag) for pid, name, _, version, flag in rows])
+
+def migrate_prompt_version_text(conn: sqlite3.Connection) -> None:
+    """Rebuild a prompt_versions table that still holds full text as recipes."""
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(prompt_versions)")]
+    if 'prompt' not in columns:
+        return
+    rows = conn.execute('SELECT prompt_id, version, name, prompt FROM prompt_versions').fetchall()
+    # configs references prompt_versions, so drop and recreate (see above)
+    conn.execute('DROP TABLE prompt_versions')
+    create_vote_tables(conn)
+    conn.executemany('INSERT INTO prompt_versions (prompt_id, version, name, recipe) VALUES (?, ?, ?, ?)',
+                     [(pid, version, name, store_prompt_text(conn, text)[0]) for pid, version, name, text in rows])
+
+def backfill_prompt_version_times(conn: sqlite3.Connection) -> None:
+    """Date prompt_versions rows that predate created_at.
+
+    A version is dated by its first vote where it has one, otherwise by
+    the migration; replaced versions are never dated after the prompt's
+    oldest known one, so the current version still sorts newest.
+    """
+    conn.execute('''
+        UPDATE prompt_versions SET created_at = (
+            SELECT MIN(v.ts) FROM configs c JOIN votes v ON v.config_a = c.id OR v.config_b = c.id
+            WHERE c.prompt_id = prompt_versions.prompt_id AND c.prompt_version = prompt_versions.version
+        )
+        WHERE created_at IS NULL
+    ''')
+    now = datetime.utcnow().isoformat()
+    conn.execute('''
+        UPDATE prompt_versions SET created_at = COALESCE((
+            SELECT MIN(o.created_at) FROM prompt_versions o WHERE o.prompt_id = prompt_versions.prompt_id
+        ), ?)
+        WHERE created_at IS NULL
+          AND version != COALESCE((SELECT p.version FROM prompts p WHERE p.id = prompt_versions.prompt_id), '')
+    ''', (now,))
+    conn.execute('UPDATE prompt_versions SET created_at = ? WHERE created_at IS NULL', (now,))
+
+def count_prompt_versions(conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+    """Recorded versions per prompt id."""
+    conn = conn or connection()
+    return dict(conn.execute('SELECT prompt_id, COUNT(*) FROM prompt_versions GROUP BY prompt_id').fetchall())
+
+def record_prompt_version(conn: sqlite3.Connection, prompt_id: str, name: str, text: str) -> str:
+    """Append a prompt's text to its versions (once per distinct text); returns the version."""
+    version = prompt_hash(text)
+    known = conn.execute(
+        'SELECT 1 FROM prompt_versions WHERE prompt_id = ? AND version = ?', (prompt_id, version)
+    ).fetchone()
+    if not known:
+        conn.execute(
+            'INSERT INTO prompt_versions (prompt_id, version, name, recipe, created_at) VALUES (?, ?, ?, ?, ?)',
+            (prompt_id, version, name, store_prompt_text(conn, text)[0], datetime.utcnow().isoformat())
+        )
+    return version
+
+# -----------------------------------------------------------------------------
+# Votes schema
+# -----------------------------------------------------------------------------
+# A vote is two configs, a winner and its turns. A config is a model plus
+# one exact prompt text, identified by the text's SHA-256 so prompt edits
+# show up as new configs instead of silently merging. Prompt versions are
+# recorded when a prompt is saved, so votes only need to carry
+# (prompt id, version).
+
+WINNERS = {'left': 'a', 'right': 'b', 'tie': 'tie'}
+
+MIGRATION_BATCH = 500
+
+def create_prompts_table(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prompts (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            version TEXT NOT NULL,
+            active INTEGER DEFAULT 1
+        )
+    ''')
+
+def create_prompt_versions_table(conn: sqlite3.Connection) -> None:
+    # Append-only: a row is never updated or deleted once written
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prompt_versions (
+            prompt_id TEXT NOT NULL,
+            version TEXT NOT NULL,
+            name TEXT NOT NULL,
+            recipe TEXT NOT NULL,
+            created_at TEXT,
+            PRIMARY KEY (prompt_id, version)
+        )
+    ''')
+    version_columns = [column[1] for column in conn.execute("PRAGMA table_info(prompt_versions)")]
+    if 'created_at' not in version_columns:
+        conn.execute('ALTER TABLE prompt_versions ADD COLUMN created_at TEXT')
+
+def create_vote_tables(conn: sqlite3.Connection) -> None:
+    create_prompt_versions_table(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS configs (
+            id INTEGER PRIMARY KEY,
+            model_id TEXT NOT NULL,
+            model_name TEXT NOT NULL,
+            prompt_id TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            UNIQUE (model_id, prompt_id, prompt_version),
+            FOREIGN KEY (prompt_id, prompt_version) REFERENCES prompt_versions (prompt_id, version)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            config_a INTEGER NOT NULL REFERENCES configs (id),
+            config_b INTEGER NOT NULL REFERENCES configs (id),
+            winner TEXT NOT NULL CHECK (winner IN ('a', 'b', 'tie')),
+            ts TEXT NOT NULL,
+            spill_id TEXT
+        )
+    ''')
+    vote_columns = [column[1] for column in conn.execute("PRAGMA table_info(votes)")]
+    if 'spill_id' not in vote_columns:
+        conn.execute('ALTER TABLE votes ADD COLUMN spill_id TEXT')
+    # The vote writer's id for a queued vote, so a replayed one is never recorded twice
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS votes_spill_id ON votes (spill_id) WHERE spill_id IS NOT NULL')
+    # Grouping votes by prompt version goes configs -> votes through these
+    conn.execute('CREATE INDEX IF NOT EXISTS configs_prompt_version ON configs (prompt_id, prompt_version)')
+    conn.execute('CREATE INDEX IF NOT EXISTS votes_config_a ON votes (config_a)')
+    conn.execute('CREATE INDEX IF NOT EXISTS votes_config_b ON votes (config_b)')
+    conn.execute('CREATE INDEX IF NOT EXISTS votes_ts ON votes (ts)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS turns (
+            vote_id INTEGER NOT NULL REFERENCES votes (id),
+            idx INTEGER NOT NULL,
+            user TEXT NOT NULL,
+            left TEXT NOT NULL,
+            right TEXT NOT NULL,
+            PRIMARY KEY (vote_id, idx)
+        ) WITHOUT ROWID
+    ''')
+
+def create_leaderboard_tables(conn: sqlite3.Connection) -> None:
+    """Online Elo ratings and per-pair totals kept by leaderboard.py."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS elo_ratings (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            rating REAL NOT NULL,
+            games INTEGER NOT NULL,
+            PRIMARY KEY (scope, key)
+        )
+    ''')
+    # Head-to-head totals per config pair (config_lo < config_hi), which is
+    # all Bradley-Terry needs; refits never have to rescan votes.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pair_counts (
+            config_lo INTEGER NOT NULL,
+            config_hi INTEGER NOT NULL,
+            wins_lo INTEGER NOT NULL DEFAULT 0,
+            wins_hi INTEGER NOT NULL DEFAULT 0,
+            ties INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (config_lo, config_hi)
+        )
+    ''')
+
+def prompt_hash(text: str) -> str:
+    """Content hash identifying one exact version of a prompt."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def config_ref(config: Dict) -> Dict:
+    """A config as carried by a vote: model plus prompt id and version.
+
+    Prompts loaded from the database already have a prompt_versions row,
+    so their text is dropped; others keep it so config_id can record it.
+    """
+    model, prompt = config['model'], config['prompt']
+    ref = {'id': prompt['id'], 'name': prompt['name']}
+    if prompt.get('version'):
+        ref['version'] = prompt['version']
+    else:
+        ref['prompt'] = prompt['prompt']
+    return {'model': {'id': model['id'], 'name': model['name']}, 'prompt': ref}
+
+def config_id(conn: sqlite3.Connection, config: Dict) -> int:
+    """Return the configs row for a {"model", "prompt"} dict, creating it if new.
+
+    The prompt needs either its text or the version of a prompt that was
+    saved (so its prompt_versions row exists).
+    """
+    model, prompt = config['model'], config['prompt']
+    if 'prompt' in prompt:
+        version = record_prompt_version(conn, prompt['id'], prompt['name'], prompt['prompt'])
+    else:
+        version = prompt['version']
+    conn.execute(
+        'INSERT OR IGNORE INTO configs (model_id, model_name, prompt_id, prompt_version) VALUES (?, ?, ?, ?)',
+        (model['id'], model['name'], prompt['id'], version)
+    )
+    return conn.execute(
+        'SELECT id FROM configs WHERE model_id = ? AND prompt_id = ? AND prompt_version = ?',
+        (model['id'], prompt['id'], version)
+    ).fetchone()[0]
+
+def insert_vote(conn: sqlite3.Connection, conversation: List[Dict], left_config: Dict,
+                right_config: Dict, winner: str, ts: str, vote_id: Optional[int] = None,
+                spill_id: Optional[str] = None) -> int:
+    """Write one vote and its turns inside the caller's transaction."""
+    cur = conn.execute(
+        'INSERT INTO votes (id, config_a, config_b, winner, ts, spill_id) VALUES (?, ?, ?, ?, ?, ?)',
+        (vote_id, config_id(conn, left_config), config_id(conn, right_config), WINNERS[winner], ts, spill_id)
+    )
+    conn.executemany(
+        'INSERT INTO turns (vote_id, idx, user, left, right) VALUES (?, ?, ?, ?, ?)',
+        [(cur.lastrowid, i, turn['user'], turn['left'], turn['right']) for i, turn in enumerate(conversation)]
+    )
+    return cur.lastrowid
+
+def _migrate_legacy_votes_logged() -> None:
+    try:
+        moved = migrate_legacy_votes()
+    except Exception:
+        logger.exception("Legacy vote migration failed; it resumes on the next start")
+    else:
+        logger.info("Migrated %d legacy votes", moved)
+
+def migrate_legacy_votes(batch_size: int = MIGRATION_BATCH) -> int:
+    """Copy JSON-blob votes from votes_legacy into the normalized tables.
+
+    Runs one short transaction per batch, deleting each batch from the
+    legacy table as it goes, so the app keeps serving (and recording new
+    votes) during the migration and an interrupted run simply resumes.
+    The legacy table is dropped once empty. Returns the number of votes moved.
+    """
+    moved = 0
+    while True:
+        with transaction(immediate=True) as conn:
+            legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'votes_legacy'"
+            ).fetchone()
+            if not legacy:
+                return moved
+
+            rows = conn.execute('''
+                SELECT id, timestamp, conversation, left_config, right_config, winner
+                FROM votes_legacy ORDER BY id LIMIT ?
+            ''', (batch_size,)).fetchall()
+            if not rows:
+                conn.execute('DROP TABLE votes_legacy')
+                return moved
+
+            for vote_id, ts, conversation, left_config, right_config, winner in rows:
+                insert_vote(conn, json.loads(conversation), json.loads(left_config),
+                            json.loads(right_config), winner, ts, vote_id=vote_id)
+            conn.executemany('DELETE FROM votes_legacy WHERE id = ?', [(row[0],) for row in rows])
+        moved += len(rows)
+
+# -----------------------------------------------------------------------------
+# Batch evaluation
+# -----------------------------------------------------------------------------
+# batch_eval.py replays scripted scenarios against every config. Each
+# conversation is stored once (eval_conversations + eval_turns); eval_pairs
+# puts two conversations of the same scenario side by side, with no winner
+# until one is judged, so they never reach the leaderboard or the pairing
+# counts. The eval_pair_turns view reads a pair back in the shape votes
+# use: user / left / right per turn.
+
+def create_eval_tables(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS eval_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scenario_file TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    ''')
+    # Pairs from before conversations were stored once held both replies
+    # per turn; rebuild them on top of eval_conversations
+    legacy_turns = 'pair_id' in [column[1] for column in conn.execute("PRAGMA table_info(eval_turns)")]
+    if legacy_turns:
+        conn.execute('ALTER TABLE eval_turns RENAME TO eval_turns_legacy')
+        conn.execute('ALTER TABLE eval_pairs RENAME TO eval_pairs_legacy')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS eval_conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL REFERENCES eval_runs (id),
+            scenario TEXT NOT NULL,
+            config INTEGER NOT NULL REFERENCES configs (id),
+            ts TEXT NOT NULL,
+            UNIQUE (run_id, scenario, config)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS eval_turns (
+            conversation_id INTEGER NOT NULL REFERENCES eval_conversations (id),
+            idx INTEGER NOT NULL,
+            user TEXT NOT NULL,
+            reply TEXT NOT NULL,
+            PRIMARY KEY (conversation_id, idx)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS eval_pairs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_a INTEGER NOT NULL REFERENCES eval_conversations (id),
+            conversation_b INTEGER NOT NULL REFERENCES eval_conversations (id),
+            winner TEXT CHECK (winner IN ('a', 'b', 'tie')),
+            ts TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS eval_pair_turns AS
+        SELECT p.id AS pair_id, ta.idx AS idx, ta.user AS user, ta.reply AS left, tb.reply AS right
+        FROM eval_pairs p
+        JOIN eval_turns ta ON ta.conversation_id = p.conversation_a
+        JOIN eval_turns tb ON tb.conversation_id = p.conversation_b AND tb.idx = ta.idx
+    ''')
+    if legacy_turns:
+        migrate_legacy_eval_pairs(conn)
+
+def migrate_legacy_eval_pairs(conn: sqlite3.Connection) -> None:
+    """Split pairs that stored both transcripts into one conversation per config."""
+    conversations: Dict[Tuple[int, str, int], int] = {}
+    for pair_id, run_id, scenario, config_a, config_b, winner, ts in conn.execute(
+        'SELECT id, run_id, scenario, config_a, config_b, winner, ts FROM eval_pairs_legacy ORDER BY id'
+    ).fetchall():
+        turns = conn.execute(
+            'SELECT idx, user, left, right FROM eval_turns_legacy WHERE pair_id = ? ORDER BY idx', (pair_id,)
+        ).fetchall()
+        ids = []
+        for config, side in ((config_a, 2), (config_b, 3)):
+            key = (run_id, scenario, config)
+            if key not in conversations:
+                conversations[key] = insert_eval_conversation(
+                    conn, run_id, scenario, config, [turn[1] for turn in turns], [turn[side] for turn in turns], ts
+                )
+            ids.append(conversations[key])
+        conn.execute('INSERT INTO eval_pairs (id, conversation_a, conversation_b, winner, ts) VALUES (?, ?, ?, ?, ?)',
+                     (pair_id, *ids, winner, ts))
+    conn.execute('DROP TABLE eval_turns_legacy')
+    conn.execute('DROP TABLE eval_pairs_legacy')
+
+def start_eval_run(scenario_file: str) -> int:
+    """Record the start of a batch run and return its id."""
+    with transaction(immediate=True) as conn:
+        cur = conn.execute('INSERT INTO eval_runs (scenario_file, started_at) VALUES (?, ?)',
+                           (scenario_file, datetime.utcnow().isoformat()))
+        return cur.lastrowid
+
+def finish_eval_run(run_id: int) -> None:
+    with transaction(immediate=True) as conn:
+        conn.execute('UPDATE eval_runs SET finished_at = ? WHERE id = ?', (datetime.utcnow().isoformat(), run_id))
+
+def insert_eval_conversation(conn: sqlite3.Connection, run_id: int, scenario: str, config: int,
+                             users: List[str], replies: List[str], ts: str) -> int:
+    cur = conn.execute('INSERT INTO eval_conversations (run_id, scenario, config, ts) VALUES (?, ?, ?, ?)',
+                       (run_id, scenario, config, ts))
+    conn.executemany('INSERT INTO eval_turns (conversation_id, idx, user, reply) VALUES (?, ?, ?, ?)',
+                     [(cur.lastrowid, i, user, reply) for i, (user, reply) in enumerate(zip(users, replies))])
+    return cur.lastrowid
+
+def save_eval_conversation(run_id: int, scenario: str, config: Dict,
+                           users: List[str], replies: List[str]) -> int:
+    """Save one finished scripted conversation for a {"model", "prompt"} config; returns its id."""
+    with transaction(immediate=True) as conn:
+        return insert_eval_conversation(conn, run_id, scenario, config_id(conn, config), users, replies,
+                                        datetime.utcnow().isoformat())
+
+def save_eval_pairs(pairs: List[Tuple[int, int]]) -> List[int]:
+    """Pair up saved conversations as (left, right) for judging; returns the eval_pairs ids."""
+    ts = datetime.utcnow().isoformat()
+    with transaction(immediate=True) as conn:
+        return [
+            conn.execute('INSERT INTO eval_pairs (conversation_a, conversation_b, ts) VALUES (?, ?, ?)',
+                         (left, right, ts)).lastrowid
+            for left, right in pairs
+        ]
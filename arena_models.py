@@ -0,0 +1,41 @@
+from typing import List, Dict, Optional
+
+from llm_client import stream_completion
+from history import HistoryWindow, token_budget
+from image_store import materialize_messages
+
+# -----------------------------------------------------------------------------
+# Models under comparison
+# -----------------------------------------------------------------------------
+# Shared by the Streamlit arena (chat_arena_v2.py) and the headless batch
+# runner (batch_eval.py), so both compare the same models the same way.
+
+# Model configurations
+MODELS = [
+    {"id": "gpt-4.1", "name": "GPT-4.1"},
+    {"id": "gpt-4.5-preview", "name": "GPT-4.5 Preview"},
+    {"id": "gpt-4.1-mini", "name": "GPT-4.1 Mini"},
+]
+
+
+def stream_chat_completion(model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 1000,
+                           window: Optional[HistoryWindow] = None):
+    """Stream chat completion from OpenAI.
+
+    Goes through llm_client's rate-limit scheduler, which retries before
+    the first token; failures raise CompletionError rather than being
+    streamed as reply text, so they never end up in a history. With a
+    window, only the system prompt and the recent turns that fit the
+    model's token budget are sent.
+    """
+    prompt_tokens = None
+    if window is not None:
+        messages = window.window(messages, token_budget(model, max_tokens))
+        prompt_tokens = window.window_tokens
+    yield from stream_completion(
+        model,
+        materialize_messages(messages),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        prompt_tokens=prompt_tokens,
+    )
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Replay scripted coaching scenarios against every model x prompt config.
+
+Each scenario is a fixed list of user turns (text, optionally with images)
+played as one conversation per config: every model in arena_models.MODELS
+with every active prompt from the prompts table, through the same
+stream_chat_completion the arena uses. Conversations run concurrently on
+a bounded worker pool; turns within one conversation run in order.
+
+Each finished conversation is saved once, into eval_conversations and
+eval_turns, and every two configs that completed a scenario become an
+eval_pairs row referencing both, with no winner yet, so they can be
+judged later without touching the leaderboard. Prints conversations per minute and,
+per config, time-to-first-token and full-reply latency percentiles.
+
+Scenario file (JSON; image paths are relative to the file):
+    [{"id": "transitions",
+      "turns": ["my teacher keeps losing the class during transitions",
+                {"user": "here's the lesson plan", "images": ["plan.png"]}]}]
+
+Pass --mock to run against benchmarks/mock_openai.py started in-process,
+with transcripts saved to a scratch database unless --db is given; the
+scratch database gets the active prompts of NISA_ARENA_DB (or the recipes
+in prompts.py when that can't be read).
+
+Usage: python batch_eval.py [scenarios/coaching.json] [--workers 8] [--models gpt-4.1 ...] [--mock] [--db nisa_arena.db] [--no-save]
+"""
+
+import os
+import json
+import sqlite3
+import time
+import random
+import argparse
+import tempfile
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import arena_db
+from arena_models import MODELS, stream_chat_completion
+from history import HistoryWindow
+from image_store import store_upload, IMAGE_DETAIL
+from llm_client import CompletionError
+from prompt_registry import load_active_prompts, save_system_prompts
+from prompts import RECIPES, assemble
+from streaming import ResponseBuffer, StreamStats
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+DEFAULT_SCENARIOS = os.path.join("scenarios", "coaching.json")
+# Conversations in flight at once; llm_client's scheduler still paces the
+# requests themselves against each model's rate limits
+DEFAULT_WORKERS = 8
+TEMPERATURE = 0.7
+MAX_TOKENS = 1000
+
+PERCENTILES = (50, 95)
+
+# -----------------------------------------------------------------------------
+# Scenarios
+# -----------------------------------------------------------------------------
+
+def load_scenarios(path: str) -> List[Dict]:
+    """Read a scenario file into [{"id", "messages": [user message, ...], "texts": [...]}].
+
+    Images are preprocessed and stored once here, so every config's
+    conversation refers to the same stored copies.
+    """
+    with open(path) as f:
+        raw = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+
+    scenarios = []
+    for i, scenario in enumerate(raw):
+        messages, texts = [], []
+        for turn in scenario["turns"]:
+            if isinstance(turn, str):
+                turn = {"user": turn}
+            content = [{"type": "text", "text": turn["user"]}]
+            for image in turn.get("images", []):
+                with open(os.path.join(base, image), "rb") as f:
+                    ref = store_upload(f)
+                content.append({"type": "image_url", "image_url": {"url": ref, "detail": IMAGE_DETAIL}})
+            messages.append({"role": "user", "content": content if len(content) > 1 else turn["user"]})
+            texts.append(turn["user"])
+        scenarios.append({"id": scenario.get("id", str(i)), "messages": messages, "texts": texts})
+    return scenarios
+
+
+def eval_configs(models: List[Dict], prompts: List[Dict]) -> List[Dict]:
+    """Every model with every prompt, as {"model", "prompt"} configs."""
+    return [{"model": model, "prompt": prompt} for model in models for prompt in prompts]
+
+
+def config_label(config: Dict) -> str:
+    return f"{config['model']['name']} + {config['prompt']['name']}"
+
+# -----------------------------------------------------------------------------
+# Replay
+# -----------------------------------------------------------------------------
+
+def run_conversation(scenario: Dict, config: Dict, max_tokens: int = MAX_TOKENS) -> Dict:
+    """Play one scenario against one config, turn by turn.
+
+    Returns {"scenario", "config", "replies", "stats", "error"}; a turn
+    that fails ends the conversation with the error message set.
+    """
+    messages = [{"role": "system", "content": config["prompt"]["prompt"]}]
+    window = HistoryWindow()
+    result = {"scenario": scenario["id"], "config": config, "replies": [], "stats": [], "error": None}
+    for user_msg in scenario["messages"]:
+        messages.append(user_msg)
+        stats = StreamStats(started_at=time.perf_counter())
+        reply = ResponseBuffer()
+        try:
+            for chunk in stream_chat_completion(config["model"]["id"], messages, TEMPERATURE, max_tokens,
+                                                window=window):
+                if stats.first_token_at is None:
+                    stats.first_token_at = time.perf_counter()
+                stats.chunks += 1
+                reply.append(chunk)
+        except CompletionError as e:
+            result["error"] = str(e)
+            return result
+        stats.finished_at = time.perf_counter()
+        messages.append({"role": "assistant", "content": reply.getvalue()})
+        result["replies"].append(reply.getvalue())
+        result["stats"].append(stats)
+    return result
+
+
+def pair_transcripts(results: List[Dict], rng: random.Random) -> List[Tuple[Dict, Dict]]:
+    """(left, right) results for every two configs that finished.
+
+    Sides are shuffled per pair, so whoever judges them later can't learn
+    a position from the config order.
+    """
+    finished = [r for r in results if r["error"] is None]
+    pairs = []
+    for left, right in combinations(finished, 2):
+        if rng.random() < 0.5:
+            left, right = right, left
+        pairs.append((left, right))
+    return pairs
+
+
+def run_batch(scenarios: List[Dict], configs: List[Dict], workers: int = DEFAULT_WORKERS,
+              max_tokens: int = MAX_TOKENS, run_id: Optional[int] = None, seed: Optional[int] = None) -> List[Dict]:
+    """Replay every scenario against every config; returns all conversation results.
+
+    With a run_id, each conversation is saved as soon as it finishes
+    (its id under "conversation_id"), and each scenario's pairs once its
+    last conversation does.
+    """
+    rng = random.Random(seed)
+    by_scenario = {s["id"]: s for s in scenarios}
+    remaining = {s["id"]: len(configs) for s in scenarios}
+    finished: Dict[str, List[Dict]] = {s["id"]: [] for s in scenarios}
+    results = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_conversation, s, c, max_tokens) for s in scenarios for c in configs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["error"] is None and run_id is not None:
+                result["conversation_id"] = arena_db.save_eval_conversation(
+                    run_id, result["scenario"], result["config"],
+                    by_scenario[result["scenario"]]["texts"], result["replies"]
+                )
+            scenario_id = result["scenario"]
+            finished[scenario_id].append(result)
+            remaining[scenario_id] -= 1
+            if remaining[scenario_id] == 0 and run_id is not None:
+                # Completion order varies run to run; pair in config order
+                done = sorted(finished[scenario_id], key=lambda r: configs.index(r["config"]))
+                pairs = pair_transcripts(done, rng)
+                if pairs:
+                    arena_db.save_eval_pairs([(left["conversation_id"], right["conversation_id"]) for left, right in pairs])
+    return results
+
+def mock_prompts() -> List[Dict]:
+    """Active prompts to seed a scratch database with.
+
+    Read from NISA_ARENA_DB without changing it; the recipes in prompts.py
+    stand in when it can't be read or has none active.
+    """
+    try:
+        prompts = arena_db.read_active_prompts(arena_db.DB_PATH)
+    except sqlite3.Error:
+        prompts = []
+    return prompts or [{"id": name, "name": name, "prompt": assemble(recipe)} for name, recipe in RECIPES.items()]
+
+# -----------------------------------------------------------------------------
+# Report
+# -----------------------------------------------------------------------------
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile; NaN for no values."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def report(results: List[Dict], elapsed: float) -> None:
+    done = sum(1 for r in results if r["error"] is None)
+    print(f"{done}/{len(results)} conversations in {elapsed:.1f}s: {done / elapsed * 60:.1f} conversations/minute")
+
+    by_config: Dict[str, List[Dict]] = {}
+    for result in results:
+        by_config.setdefault(config_label(result["config"]), []).append(result)
+
+    columns = [f"ttft p{q}" for q in PERCENTILES] + [f"total p{q}" for q in PERCENTILES]
+    width = max(len(label) for label in by_config)
+    print(f"\n{'config':<{width}}  {'convs':>5}  {'errors':>6}  " + "  ".join(f"{c:>9}" for c in columns))
+    for label, config_results in sorted(by_config.items()):
+        stats = [s for r in config_results for s in r["stats"]]
+        ttfts = [s.time_to_first_token for s in stats if s.time_to_first_token is not None]
+        totals = [s.total_latency for s in stats if s.total_latency is not None]
+        values = [percentile(ttfts, q) for q in PERCENTILES] + [percentile(totals, q) for q in PERCENTILES]
+        errors = sum(1 for r in config_results if r["error"] is not None)
+        print(f"{label:<{width}}  {len(config_results):>5}  {errors:>6}  " + "  ".join(f"{v:>8.2f}s" for v in values))
+
+    for result in results:
+        if result["error"] is not None:
+            print(f"  ! {result['scenario']} / {config_label(result['config'])}: {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scenarios", nargs="?", default=DEFAULT_SCENARIOS, help="scenario JSON file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="conversations in flight at once")
+    parser.add_argument("--models", nargs="+", help="model ids to include (default: all of MODELS)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--db", help="database for prompts and transcripts (default: NISA_ARENA_DB)")
+    parser.add_argument("--no-save", action="store_true", help="only report, don't store transcripts")
+    parser.add_argument("--mock", action="store_true", help="run against an in-process mock OpenAI endpoint")
+    parser.add_argument("--seed", type=int, help="seed for the left/right order of saved pairs")
+    args = parser.parse_args()
+
+    load_dotenv()
+    seed_prompts = None
+    if args.mock:
+        from benchmarks.mock_openai import start_server
+        _, base_url = start_server()
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+        if not args.db:
+            # Mock replies don't belong next to real ones, but should be
+            # replayed with the same prompts
+            seed_prompts = mock_prompts()
+            args.db = os.path.join(tempfile.mkdtemp(prefix="nisa_eval_"), "nisa_arena.db")
+            print(f"🔍 Mock OpenAI on {base_url}, transcripts in {args.db}")
+    if args.db:
+        arena_db.set_db_path(args.db)
+    arena_db.init_db()
+    if seed_prompts is not None:
+        save_system_prompts(seed_prompts)
+
+    models = [m for m in MODELS if not args.models or m["id"] in args.models]
+    configs = eval_configs(models, load_active_prompts())
+    scenarios = load_scenarios(args.scenarios)
+    if not configs or not scenarios:
+        parser.error("nothing to run: no matching models, active prompts or scenarios")
+    print(f"{len(scenarios)} scenarios x {len(configs)} configs = {len(scenarios) * len(configs)} conversations, "
+          f"{args.workers} workers")
+
+    run_id = None if args.no_save else arena_db.start_eval_run(os.path.abspath(args.scenarios))
+    start = time.perf_counter()
+    results = run_batch(scenarios, configs, args.workers, args.max_tokens, run_id, args.seed)
+    elapsed = time.perf_counter() - start
+    if run_id is not None:
+        arena_db.finish_eval_run(run_id)
+        print(f"Saved eval run {run_id}")
+    report(results, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark vote inserts under concurrent writers.
+
+Compares the original connect/commit/close-per-call save_vote (writing the
+original JSON-blob votes table) against arena_db.save_vote on pooled WAL
+connections, and against vote_queue's write-behind writer, where the rate
+is what the vote button sees and the drain time is how long the
+group-committing writer takes to get everything on disk. Runs against
+throwaway databases in a temp directory, never against nisa_arena.db.
+
+Usage: python benchmarks/bench_db_votes.py [--writers 8] [--votes 200]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arena_db
+from vote_queue import VoteWriter
+
+CONVERSATION = [
+    {"user": "my teacher keeps losing the class during transitions", "left": "x" * 800, "right": "y" * 800}
+] * 4
+CONFIG = {"model": {"id": "gpt-4.1", "name": "GPT-4.1"}, "prompt": {"id": "p", "name": "p", "prompt": "z" * 6000}}
+
+
+def legacy_save_vote(path: str) -> None:
+    """The pre-pool save_vote: fresh connection and default journal per call."""
+    conn = sqlite3.connect(path, timeout=30)
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO votes (timestamp, conversation, left_config, right_config, winner)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (
+        datetime.utcnow().isoformat(),
+        json.dumps(CONVERSATION),
+        json.dumps(CONFIG),
+        json.dumps(CONFIG),
+        "left"
+    ))
+    conn.commit()
+    conn.close()
+
+
+def pooled_save_vote(path: str) -> None:
+    arena_db.save_vote(CONVERSATION, CONFIG, CONFIG, "left")
+
+
+def queued_save_vote(writer: VoteWriter) -> None:
+    writer.submit(CONVERSATION, CONFIG, CONFIG, "left")
+
+
+def run(save, path: str, writers: int, votes: int) -> float:
+    """Return votes/sec for `writers` threads each saving `votes` votes."""
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(votes):
+                save(path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        print(f"   ⚠️  {len(errors)} writer(s) failed, first error: {errors[0]}")
+    return writers * votes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--votes", type=int, default=200, help="votes per writer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "before.db")
+        after_path = os.path.join(tmp, "after.db")
+        queued_path = os.path.join(tmp, "queued.db")
+
+        # The legacy file keeps the original JSON-blob votes table and the
+        # default rollback journal.
+        conn = sqlite3.connect(before_path)
+        conn.execute('''
+            CREATE TABLE votes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                conversation TEXT NOT NULL,
+                left_config TEXT NOT NULL,
+                right_config TEXT NOT NULL,
+                winner TEXT NOT NULL
+            )
+        ''')
+        conn.close()
+        arena_db.set_db_path(after_path)
+        arena_db.init_db()
+
+        print(f"🔍 {args.writers} concurrent writers x {args.votes} votes\n")
+        before = run(legacy_save_vote, before_path, args.writers, args.votes)
+        print(f"before (connect per call): {before:8.1f} votes/sec")
+        after = run(pooled_save_vote, after_path, args.writers, args.votes)
+        print(f"after  (pooled + WAL):     {after:8.1f} votes/sec")
+        arena_db.get_pool().close_all()
+
+        arena_db.set_db_path(queued_path)
+        arena_db.init_db()
+        writer = VoteWriter(spill_base=queued_path + ".votes-spill")
+        writer.start()
+        queued = run(lambda _: queued_save_vote(writer), queued_path, args.writers, args.votes)
+        start = time.perf_counter()
+        writer.stop()
+        drain = time.perf_counter() - start
+        print(f"queued (write-behind):     {queued:8.1f} votes/sec at the button, {drain * 1e3:.0f}ms to drain")
+        print(f"\nspeedup: {after / before:.1f}x pooled, {queued / before:.1f}x queued")
+
+        arena_db.get_pool().close_all()
+
+
+if __name__ == "__main__":
+    main()
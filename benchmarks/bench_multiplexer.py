@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark consumer CPU cost and token jitter for concurrent duels.
+
+Compares the old chat_arena.py loop (two queues polled with get_nowait()
+and time.sleep(0.01)) against streaming.ConcurrentStreams, which blocks on
+one merged queue. Each simulated duel streams two fake replies at a fixed
+token rate; every token carries the time it was produced so the consumer
+can measure how long it sat in the queue.
+
+Usage: python benchmarks/bench_multiplexer.py [--duels 30] [--tokens 200]
+"""
+
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import ConcurrentStreams
+
+
+FIRST_TOKEN_DELAY = 1.0
+
+
+def fake_stream(tokens: int, interval: float):
+    time.sleep(FIRST_TOKEN_DELAY)
+    for _ in range(tokens):
+        time.sleep(interval)
+        yield time.perf_counter()
+
+
+def polling_duel(tokens: int, interval: float, delays: list) -> None:
+    """The pre-multiplexer consumer loop from chat_arena.py."""
+    def _collect_tokens(q):
+        for tok in fake_stream(tokens, interval):
+            q.put(tok)
+        q.put(None)
+
+    left_q: queue.Queue = queue.Queue()
+    right_q: queue.Queue = queue.Queue()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        pool.submit(_collect_tokens, left_q)
+        pool.submit(_collect_tokens, right_q)
+        left_done = right_done = False
+        while not (left_done and right_done):
+            for q, side in ((left_q, "left"), (right_q, "right")):
+                try:
+                    tok = q.get_nowait()
+                    if tok is None:
+                        if side == "left":
+                            left_done = True
+                        else:
+                            right_done = True
+                    else:
+                        delays.append(time.perf_counter() - tok)
+                except queue.Empty:
+                    pass
+            time.sleep(0.01)
+
+
+def multiplexed_duel(tokens: int, interval: float, delays: list) -> None:
+    streams = ConcurrentStreams({
+        "left": fake_stream(tokens, interval),
+        "right": fake_stream(tokens, interval),
+    })
+    for _, tok in streams:
+        if tok is not None:
+            delays.append(time.perf_counter() - tok)
+
+
+def run(duel, duels: int, tokens: int, interval: float):
+    """Run `duels` duels at once; return (cpu seconds, wall seconds, delays)."""
+    delays: list = []
+    threads = [threading.Thread(target=duel, args=(tokens, interval, delays)) for _ in range(duels)]
+    cpu, wall = time.process_time(), time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.process_time() - cpu, time.perf_counter() - wall, sorted(delays)
+
+
+def report(label: str, cpu: float, wall: float, delays: list) -> None:
+    p50 = delays[len(delays) // 2] * 1000
+    p99 = delays[int(len(delays) * 0.99)] * 1000
+    print(f"{label:<22} cpu {cpu:6.2f}s  wall {wall:5.2f}s  "
+          f"token delay p50 {p50:5.2f}ms  p99 {p99:5.2f}ms")
+
+
+def main():
+    global FIRST_TOKEN_DELAY
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duels", type=int, default=30)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per side")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--first-token", type=float, default=FIRST_TOKEN_DELAY,
+                        help="seconds before the first token, as while the model thinks")
+    args = parser.parse_args()
+
+    FIRST_TOKEN_DELAY = args.first_token
+
+    print(f"🔍 {args.duels} concurrent duels, {args.tokens} tokens/side every {args.interval * 1000:.0f}ms\n")
+    report("sleep-polling (old)", *run(polling_duel, args.duels, args.tokens, args.interval))
+    report("multiplexer (new)", *run(multiplexed_duel, args.duels, args.tokens, args.interval))
+
+
+if __name__ == "__main__":
+    main()
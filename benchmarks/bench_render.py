@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Measure placeholder render calls and websocket bytes per streamed reply.
+
+Replays fake replies token by token at a realistic rate into a counting
+placeholder, once with the old render-every-token loop and once through
+streaming.RenderScheduler. Bytes are the UTF-8 size of every string passed
+to placeholder.markdown(), which is what Streamlit ships to the browser.
+
+Usage: python benchmarks/bench_render.py [--interval 0.02]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import RenderScheduler
+
+
+class CountingPlaceholder:
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def markdown(self, text: str) -> None:
+        self.calls += 1
+        self.bytes += len(text.encode())
+
+
+def tokens(n: int):
+    return ["word "] * n
+
+
+def per_token(n: int, interval: float) -> CountingPlaceholder:
+    """The pre-scheduler loop: one full re-render per token."""
+    ph = CountingPlaceholder()
+    response = ""
+    for tok in tokens(n):
+        time.sleep(interval)
+        response += tok
+        ph.markdown(response + "▌")
+    ph.markdown(response)
+    return ph
+
+
+def scheduled(n: int, interval: float) -> CountingPlaceholder:
+    ph = CountingPlaceholder()
+    renderer = RenderScheduler(ph)
+    response = ""
+    for tok in tokens(n):
+        time.sleep(interval)
+        response += tok
+        renderer.update(response)
+    renderer.finish(response)
+    return ph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between tokens")
+    args = parser.parse_args()
+
+    print(f"🔍 tokens every {args.interval * 1000:.0f}ms\n")
+    print(f"{'tokens':>7} | {'before calls':>12} {'before bytes':>13} | {'after calls':>11} {'after bytes':>12}")
+    for n in (100, 500, 1000):
+        before = per_token(n, args.interval)
+        after = scheduled(n, args.interval)
+        print(f"{n:>7} | {before.calls:>12} {before.bytes:>13,} | {after.calls:>11} {after.bytes:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark reply accumulation for 100, 1k and 10k token replies.
+
+Compares the old `responses[side] += chunk` pattern (the reply string is
+also referenced from a dict, so CPython cannot resize it in place) against
+streaming.ResponseBuffer. Both variants take a rendering view every 20
+tokens, roughly what RenderScheduler asks for while streaming.
+
+Usage: python benchmarks/bench_response_buffer.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import ResponseBuffer
+
+TOKEN = "token "
+VIEW_EVERY = 20
+
+
+def concat(n: int) -> str:
+    responses = {"left": ""}
+    for i in range(n):
+        responses["left"] += TOKEN
+        if i % VIEW_EVERY == 0:
+            len(responses["left"] + "▌")
+    return responses["left"]
+
+
+def buffered(n: int) -> str:
+    responses = {"left": ResponseBuffer()}
+    for i in range(n):
+        responses["left"].append(TOKEN)
+        if i % VIEW_EVERY == 0:
+            len(str(responses["left"]) + "▌")
+    return responses["left"].getvalue()
+
+
+def main():
+    print(f"{'tokens':>7} | {'concat':>10} | {'buffer':>10}")
+    for n in (100, 1_000, 10_000):
+        assert concat(n) == buffered(n)
+        number = max(1, 20_000 // n)
+        before = min(timeit.repeat(lambda: concat(n), number=number, repeat=5)) / number
+        after = min(timeit.repeat(lambda: buffered(n), number=number, repeat=5)) / number
+        print(f"{n:>7} | {before * 1e3:8.3f}ms | {after * 1e3:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Load-test time-to-first-token at 1, 10 and 50 concurrent sessions.
+
+Each simulated session runs head-to-head turns: two streamed completions
+at once, like chat_arena_v2.py. TTFT is measured from the create() call to
+the first content chunk. Runs against benchmarks/mock_openai.py started
+in-process (or any OpenAI-compatible --base-url), once with the SDK's
+default client and once with llm_client's pooled client, and reports how
+many TCP connections each opened.
+
+Usage: python benchmarks/load_ttft.py [--sessions 1 10 50] [--turns 5] [--base-url URL]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+import openai
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_client import make_client
+from mock_openai import start_server, MockHandler
+
+MESSAGES = [
+    {"role": "system", "content": "You are nisa, an instructional coach."},
+    {"role": "user", "content": "my teacher keeps losing the class during transitions"},
+]
+
+
+def ttft(client, model: str) -> float:
+    start = time.perf_counter()
+    first = None
+    stream = client.chat.completions.create(model=model, messages=MESSAGES, max_tokens=200, stream=True)
+    for chunk in stream:
+        if first is None and chunk.choices and chunk.choices[0].delta.content:
+            first = time.perf_counter() - start
+    return first
+
+
+def session(client, turns: int, results: list) -> None:
+    for _ in range(turns):
+        pair = []
+        sides = [threading.Thread(target=lambda m=m: pair.append(ttft(client, m))) for m in ("a", "b")]
+        for t in sides:
+            t.start()
+        for t in sides:
+            t.join()
+        results.extend(pair)
+
+
+def run(client, sessions: int, turns: int) -> list:
+    results: list = []
+    threads = [threading.Thread(target=session, args=(client, turns, results)) for _ in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--turns", type=int, default=5, help="head-to-head turns per session")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint (default: in-process mock)")
+    parser.add_argument("--http2", action="store_true", help="pooled client uses HTTP/2 (the mock speaks HTTP/1.1)")
+    args = parser.parse_args()
+
+    connections = [0]
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        def setup(handler, _setup=MockHandler.setup):
+            connections[0] += 1
+            _setup(handler)
+        MockHandler.setup = setup
+        _, base_url = start_server(ttft=0.2)
+
+    clients = {
+        "sdk default": lambda: openai.OpenAI(api_key="mock", base_url=base_url),
+        "llm_client": lambda: make_client(base_url=base_url, api_key="mock", http2=args.http2),
+    }
+
+    print(f"🔍 {base_url}, {args.turns} head-to-head turns per session\n")
+    print(f"{'client':>12} {'sessions':>8} | {'p50 ttft':>9} {'p95 ttft':>9} {'max':>8} | {'connections':>11}")
+    for name, factory in clients.items():
+        for sessions in args.sessions:
+            client = factory()
+            connections[0] = 0
+            times = np.array(run(client, sessions, args.turns)) * 1e3
+            opened = connections[0] if not args.base_url else "-"
+            print(f"{name:>12} {sessions:>8} | {np.percentile(times, 50):7.0f}ms {np.percentile(times, 95):7.0f}ms "
+                  f"{times.max():6.0f}ms | {opened:>11}")
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Local mock of the OpenAI chat completions endpoint for load tests.
+
+Answers POST /v1/chat/completions with a canned nisa-style reply, streamed
+as server-sent events (chunked, over keep-alive HTTP/1.1) when the request
+asks for stream=True. The first token arrives after --ttft seconds and the
+rest every --token-interval seconds, so latency numbers measured against it
+are about our client, not the model. Standard library only.
+
+Usage reports prompt_tokens_details.cached_tokens the way OpenAI's
+automatic prompt caching would: the longest whole-message prefix seen
+before, rounded down to 128 tokens, once it reaches 1024.
+
+Every response carries OpenAI-style x-ratelimit-* headers. With
+--error-rate a share of requests fail instead: 429 with retry-after, or
+a 500, before any token is sent, for exercising llm_client's retries.
+
+Point an app at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock streamlit run chat_arena_v2.py
+
+Usage: python benchmarks/mock_openai.py [--port 8765] [--ttft 0.3] [--token-interval 0.02] [--tokens 60] [--error-rate 0]
+"""
+
+import json
+import time
+import uuid
+import hashlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+DEFAULT_TTFT = 0.3
+DEFAULT_TOKEN_INTERVAL = 0.02
+DEFAULT_TOKENS = 60
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+# Advertised limits; the mock never enforces them
+RATE_LIMIT_REQUESTS = 10000
+RATE_LIMIT_TOKENS = 2000000
+
+
+def reply_tokens(n: int):
+    words = [f"word{i} " for i in range(max(2, n - 4))]
+    half = len(words) // 2
+    return ["<innermonologue>", *words[:half], "</innermonologue>", "<output>", *words[half:], "</output>"]
+
+
+def message_tokens(msg: dict) -> int:
+    return len(json.dumps(msg.get("content", ""))) // 4 + 4
+
+
+class PrefixCache:
+    """Hashes of every message prefix seen, standing in for OpenAI's cache."""
+
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, messages) -> int:
+        """Cached tokens for this request; remembers its prefixes for the next."""
+        digest = hashlib.sha256()
+        prefixes = []
+        tokens = 0
+        for msg in messages:
+            digest.update(json.dumps(msg, separators=(",", ":")).encode())
+            tokens += message_tokens(msg)
+            prefixes.append((digest.hexdigest(), tokens))
+        cached = 0
+        with self._lock:
+            for key, prefix_tokens in prefixes:
+                if key in self._seen:
+                    cached = prefix_tokens
+                self._seen.add(key)
+        if cached < CACHE_MIN_TOKENS:
+            return 0
+        return cached // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops SYNs at 50 sessions, which shows up as
+    # 1s/3s retransmit spikes that have nothing to do with the client
+    request_queue_size = 256
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefix_cache = PrefixCache()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive between requests
+
+    # Set per server by start_server()
+    ttft = DEFAULT_TTFT
+    token_interval = DEFAULT_TOKEN_INTERVAL
+    tokens = DEFAULT_TOKENS
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # Clients may drop a keep-alive connection at any time
+            pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if random.random() < self.error_rate:
+            self._send_error()
+            return
+        model = body.get("model", "mock")
+        tokens = reply_tokens(self.tokens)
+        messages = body.get("messages", [])
+        prompt_tokens = sum(message_tokens(m) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+            "prompt_tokens_details": {"cached_tokens": self.server.prefix_cache.lookup(messages)},
+        }
+
+        if body.get("stream"):
+            self._stream(model, tokens, usage, body.get("stream_options") or {})
+        else:
+            time.sleep(self.ttft + self.token_interval * len(tokens))
+            self._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+    def _rate_limit_headers(self) -> None:
+        self.send_header("x-ratelimit-limit-requests", str(RATE_LIMIT_REQUESTS))
+        self.send_header("x-ratelimit-remaining-requests", str(RATE_LIMIT_REQUESTS - 1))
+        self.send_header("x-ratelimit-reset-requests", "6ms")
+        self.send_header("x-ratelimit-limit-tokens", str(RATE_LIMIT_TOKENS))
+        self.send_header("x-ratelimit-remaining-tokens", str(RATE_LIMIT_TOKENS - 1000))
+        self.send_header("x-ratelimit-reset-tokens", "30ms")
+
+    def _send_json(self, payload: dict, status: int = 200, headers: dict = None) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self._rate_limit_headers()
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self) -> None:
+        if random.random() < 0.5:
+            self._send_json(
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after-ms": "200"},
+            )
+        else:
+            self._send_json({"error": {"message": "Internal error (mock)", "type": "server_error"}}, status=500)
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _event(self, payload) -> None:
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self._chunk(f"data: {data}\n\n".encode())
+
+    def _stream(self, model: str, tokens, usage: dict, stream_options: dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self._rate_limit_headers()
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def chunk(delta: dict, finish_reason=None) -> dict:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        time.sleep(self.ttft)
+        self._event(chunk({"role": "assistant", "content": ""}))
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_interval)
+            self._event(chunk({"content": token}))
+        self._event(chunk({}, "stop"))
+        if stream_options.get("include_usage"):
+            self._event({**chunk({}), "choices": [], "usage": usage})
+        self._event("[DONE]")
+        self._chunk(b"")
+
+
+def start_server(port: int = 0, ttft: float = DEFAULT_TTFT, token_interval: float = DEFAULT_TOKEN_INTERVAL,
+                 tokens: int = DEFAULT_TOKENS, error_rate: float = 0.0) -> Tuple[MockServer, str]:
+    """Start the mock on a background thread; returns (server, base_url)."""
+    handler = type("Handler", (MockHandler,), {
+        "ttft": ttft, "token_interval": token_interval, "tokens": tokens, "error_rate": error_rate,
+    })
+    server = MockServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=DEFAULT_TTFT, help="seconds before the first token")
+    parser.add_argument("--token-interval", type=float, default=DEFAULT_TOKEN_INTERVAL)
+    parser.add_argument("--tokens", type=int, default=DEFAULT_TOKENS, help="tokens per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/500")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, args.ttft, args.token_interval, args.tokens, args.error_rate)
+    print(f"🔍 Mock OpenAI listening on {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
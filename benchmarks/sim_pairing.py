@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Simulate how many votes it takes to reach a stable ranking.
+
+Draws hidden Bradley-Terry strengths for every (model, prompt) config and
+lets simulated coaches vote on pairs chosen either the old way (model and
+prompt picked independently per side, so a config can face itself) or by
+pairing.pick_pair. After every checkpoint the Bradley-Terry fit of the votes
+so far is compared with the true order; a ranking counts as stable from the
+first checkpoint where Kendall's tau stays at or above --tau for the rest of
+the run.
+
+Usage: python benchmarks/sim_pairing.py [--configs 12] [--trials 20] [--tau 0.9]
+"""
+
+import os
+import sys
+import random
+import argparse
+from itertools import combinations
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import fit_bradley_terry, elo_expected, ELO_BASE, ELO_K
+from pairing import pick_pair
+
+CHECK_EVERY = 20
+
+
+def kendall_tau(a: np.ndarray, b: np.ndarray) -> float:
+    pairs = list(combinations(range(len(a)), 2))
+    agree = sum(np.sign(a[i] - a[j]) * np.sign(b[i] - b[j]) for i, j in pairs)
+    return agree / len(pairs)
+
+
+def uniform_pair(n: int, rng: random.Random):
+    # The old setup: each side drawn independently, self-pairings included
+    return rng.randrange(n), rng.randrange(n)
+
+
+def simulate(strategy: str, true: np.ndarray, max_votes: int, tau: float, rng: random.Random) -> int:
+    n = len(true)
+    wins = np.zeros((n, n))
+    ratings = {i: ELO_BASE for i in range(n)}
+    games = {i: 0 for i in range(n)}
+    pair_games = {}
+    taus = []
+
+    for vote in range(1, max_votes + 1):
+        if strategy == "random":
+            a, b = uniform_pair(n, rng)
+        else:
+            a, b = pick_pair(range(n), ratings, games, pair_games, rng)
+
+        if a != b:
+            a_wins = rng.random() < elo_expected(true[a], true[b])
+            winner, loser = (a, b) if a_wins else (b, a)
+            wins[winner, loser] += 1
+
+            expected = elo_expected(ratings[a], ratings[b])
+            ratings[a] += ELO_K * (a_wins - expected)
+            ratings[b] -= ELO_K * (a_wins - expected)
+            games[a] += 1
+            games[b] += 1
+            key = frozenset((a, b))
+            pair_games[key] = pair_games.get(key, 0) + 1
+
+        if vote % CHECK_EVERY == 0:
+            taus.append(kendall_tau(fit_bradley_terry(wins), true))
+
+    stable = len(taus)
+    while stable > 0 and taus[stable - 1] >= tau:
+        stable -= 1
+    return (stable + 1) * CHECK_EVERY if stable < len(taus) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--configs", type=int, default=12, help="number of (model, prompt) configs")
+    parser.add_argument("--spread", type=float, default=150, help="std dev of true Elo ratings")
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--max-votes", type=int, default=2000)
+    parser.add_argument("--tau", type=float, default=0.9, help="Kendall's tau that counts as stable")
+    args = parser.parse_args()
+
+    results = {"random": [], "adaptive": []}
+    for trial in range(args.trials):
+        true = np.random.default_rng(trial).normal(ELO_BASE, args.spread, args.configs)
+        for strategy in results:
+            results[strategy].append(
+                simulate(strategy, true, args.max_votes, args.tau, random.Random(trial))
+            )
+
+    print(f"🔍 {args.configs} configs, {args.trials} trials, stable = Kendall's tau >= {args.tau}\n")
+    print(f"{'pairing':>9} | {'median votes':>12} | {'mean votes':>10} | {'never stable':>12}")
+    for strategy, votes in results.items():
+        reached = [v for v in votes if v is not None]
+        median = f"{np.median(reached):.0f}" if reached else "-"
+        mean = f"{np.mean(reached):.0f}" if reached else "-"
+        print(f"{strategy:>9} | {median:>12} | {mean:>10} | {len(votes) - len(reached):>12}")
+
+
+if __name__ == "__main__":
+    main()
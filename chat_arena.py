@@ -1,25 +1,22 @@
 import os
 import random
 import csv
-import base64
-import mimetypes
 from datetime import datetime
 from typing import List, Dict
 import itertools
-import concurrent.futures
-import queue
-import time
 
 import streamlit as st
 from dotenv import load_dotenv
-import openai
+from arena_models import stream_chat_completion
+from history import HistoryWindow
 from prompts import nisa_a, nisa_b, nisa_c
+from streaming import ConcurrentStreams, RenderScheduler, ResponseBuffer
+from image_store import image_part, show_image_savings
 
 # -----------------------------------------------------------------------------
 # Environment & API setup
 # -----------------------------------------------------------------------------
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # -----------------------------------------------------------------------------
 # Config
@@ -47,28 +44,6 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Helper functions
 # -----------------------------------------------------------------------------
 
-def file_to_data_url(file) -> str:
-    """Convert an uploaded image file to a base64 data URL accepted by OpenAI Vision."""
-    mime = mimetypes.guess_type(file.name)[0] or "image/png"
-    b64 = base64.b64encode(file.read()).decode()
-    return f"data:{mime};base64,{b64}"
-
-
-def stream_model_response(model: str, messages: List[Dict]):
-    """Yield tokens from a streaming chat completion."""
-    response_stream = openai.chat.completions.create(
-        model=model,
-        temperature=TEMPERATURE,
-        max_tokens=MAX_TOKENS,
-        messages=messages,
-        stream=True,
-    )
-    for chunk in response_stream:
-        token = chunk.choices[0].delta.content or ""
-        if token:
-            yield token
-
-
 def log_vote(turns: List[Dict], left_id: str, right_id: str, choice: str) -> None:
     """Append a vote record to CSV file."""
     header = ["timestamp", "conversation", "left_id", "right_id", "choice"]
@@ -208,12 +183,14 @@ if not st.session_state["vote_stage"]:
         if user_text.strip():
             content_blocks.append({"type": "text", "text": user_text})
         for f in uploaded_files or []:
-            content_blocks.append({"type": "image_url", "image_url": {"url": file_to_data_url(f)}})
+            content_blocks.append(image_part(f))
 
         user_message = {"role": "user", "content": content_blocks}
         # Append to histories
         st.session_state["history_left"].append(user_message)
         st.session_state["history_right"].append(user_message)
+        if uploaded_files:
+            show_image_savings(st.session_state["history_left"])
 
         # Display user message in both columns
         user_display = user_text if user_text.strip() else "(Image)"
@@ -224,80 +201,65 @@ if not st.session_state["vote_stage"]:
         left_ph = cols[0].chat_message("assistant").empty()
         right_ph = cols[1].chat_message("assistant").empty()
 
-        # Stream both assistants in parallel so their responses appear simultaneously
-        def _collect_tokens(model_name, history, q):
-            for tok in stream_model_response(model_name, history):
-                q.put(tok)
-            q.put(None)  # Sentinel to indicate completion
-
-        # Create queues to communicate tokens back to main thread
-        left_q: queue.Queue[str | None] = queue.Queue()
-        right_q: queue.Queue[str | None] = queue.Queue()
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
-            pool.submit(
-                _collect_tokens,
+        # Stream both assistants in parallel so their responses appear simultaneously.
+        # The multiplexer blocks until either side has a token or has finished.
+        renderers = {"left": RenderScheduler(left_ph), "right": RenderScheduler(right_ph)}
+        collected = {"left": ResponseBuffer(), "right": ResponseBuffer()}
+        # Token counts per history, so each turn only counts its new messages
+        windows = st.session_state.setdefault("history_windows", {"left": HistoryWindow(), "right": HistoryWindow()})
+        streams = ConcurrentStreams({
+            "left": stream_chat_completion(
                 st.session_state["duel"]["left_cfg"]["model"],
                 st.session_state["history_left"],
-                left_q,
-            )
-            pool.submit(
-                _collect_tokens,
+                TEMPERATURE,
+                MAX_TOKENS,
+                window=windows["left"],
+            ),
+            "right": stream_chat_completion(
                 st.session_state["duel"]["right_cfg"]["model"],
                 st.session_state["history_right"],
-                right_q,
+                TEMPERATURE,
+                MAX_TOKENS,
+                window=windows["right"],
+            ),
+        }, raise_errors=False)
+
+        for side, tok in streams:
+            if tok is None:
+                # Final render without cursor
+                renderers[side].finish(collected[side])
+            else:
+                collected[side].append(tok)
+                renderers[side].update(collected[side])
+
+        if streams.errors:
+            # Drop the turn from both histories rather than keep a half-answered one
+            st.session_state["history_left"].pop()
+            st.session_state["history_right"].pop()
+            left_ph.empty()
+            right_ph.empty()
+            failed = " and ".join(side.capitalize() for side in sorted(streams.errors))
+            st.error(f"{failed} assistant couldn't answer just now. Please send your message again.")
+        else:
+            left_resp_collected = collected["left"].getvalue()
+            right_resp_collected = collected["right"].getvalue()
+
+            # Commit responses to history
+            st.session_state["history_left"].append(
+                {"role": "assistant", "content": left_resp_collected}
+            )
+            st.session_state["history_right"].append(
+                {"role": "assistant", "content": right_resp_collected}
             )
 
-            left_resp_collected = ""
-            right_resp_collected = ""
-            left_done = right_done = False
-
-            # Loop until both sides have finished streaming
-            while not (left_done and right_done):
-                # Process left queue
-                try:
-                    tok = left_q.get_nowait()
-                    if tok is None:
-                        left_done = True
-                    else:
-                        left_resp_collected += tok
-                        left_ph.markdown(left_resp_collected + "▌")
-                except queue.Empty:
-                    pass
-
-                # Process right queue
-                try:
-                    tok = right_q.get_nowait()
-                    if tok is None:
-                        right_done = True
-                    else:
-                        right_resp_collected += tok
-                        right_ph.markdown(right_resp_collected + "▌")
-                except queue.Empty:
-                    pass
-
-                time.sleep(0.01)
-
-            # Final render without cursor
-            left_ph.markdown(left_resp_collected)
-            right_ph.markdown(right_resp_collected)
-
-        # Commit responses to history
-        st.session_state["history_left"].append(
-            {"role": "assistant", "content": left_resp_collected}
-        )
-        st.session_state["history_right"].append(
-            {"role": "assistant", "content": right_resp_collected}
-        )
-
-        # Add to turns for future display
-        st.session_state["turns"].append(
-            {
-                "user_display": user_display,
-                "left_resp": left_resp_collected,
-                "right_resp": right_resp_collected,
-            }
-        )
+            # Add to turns for future display
+            st.session_state["turns"].append(
+                {
+                    "user_display": user_display,
+                    "left_resp": left_resp_collected,
+                    "right_resp": right_resp_collected,
+                }
+            )
 
     st.divider()
     if st.button("Vote Now / Finish Chat", type="primary", disabled=len(st.session_state["turns"]) == 0):
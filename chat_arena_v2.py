@@ -1,155 +1,43 @@
-import os
-import json
-import random
-import base64
-import mimetypes
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict
 import hashlib
-import sqlite3
 
 import streamlit as st
 from dotenv import load_dotenv
-import openai
+
+from arena_db import init_db, load_fragment_library
+from llm_client import CompletionError, cache_stats
+from history import HistoryWindow
+from arena_models import MODELS, stream_chat_completion
+from vote_queue import get_vote_writer, submit_vote
+from formatting import format_response_with_tags, StreamingTagFormatter, RenderedTranscript
+from streaming import ConcurrentStreams, RenderScheduler
+from image_store import image_part, show_image_savings
+from leaderboard import leaderboard, SCOPES
+from pairing import choose_pair
+from prompt_registry import (
+    load_system_prompts,
+    load_active_prompts,
+    load_prompt_version_counts,
+    save_system_prompts,
+)
 
 # -----------------------------------------------------------------------------
 # Configuration
 # -----------------------------------------------------------------------------
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Constants
 SETTINGS_PASSWORD = "admin123"  # Hardcoded password for settings access
 
-# Model configurations
-MODELS = [
-    {"id": "gpt-4.1", "name": "GPT-4.1"},
-    {"id": "gpt-4.5-preview", "name": "GPT-4.5 Preview"},
-    {"id": "gpt-4.1-mini", "name": "GPT-4.1 Mini"},
-]
-
-# Default system prompts if database doesn't exist
-DEFAULT_PROMPTS = [
-    {
-        "id": "helpful_assistant",
-        "name": "!Saved Prompts Didn't Load",
-        "prompt": "You are a helpful, harmless, and honest AI assistant."
-    },
-]
-
 # -----------------------------------------------------------------------------
 # Database Functions
 # -----------------------------------------------------------------------------
+# All DB access goes through the pooled connections in arena_db. Prompt reads
+# are served from the shared cache in prompt_registry.
 
-def init_db():
-    """Initialize the SQLite database with required tables."""
-    conn = sqlite3.connect('nisa_arena.db')
-    c = conn.cursor()
-    
-    # Create prompts table if it doesn't exist
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS prompts (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            prompt TEXT NOT NULL,
-            active INTEGER DEFAULT 1
-        )
-    ''')
-    
-    # Add active column to existing tables if it doesn't exist
-    c.execute("PRAGMA table_info(prompts)")
-    columns = [column[1] for column in c.fetchall()]
-    if 'active' not in columns:
-        c.execute('ALTER TABLE prompts ADD COLUMN active INTEGER DEFAULT 1')
-    
-    # Create votes table if it doesn't exist
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS votes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            conversation TEXT NOT NULL,
-            left_config TEXT NOT NULL,
-            right_config TEXT NOT NULL,
-            winner TEXT NOT NULL
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def load_system_prompts() -> List[Dict[str, str]]:
-    """Load system prompts from database, creating default if doesn't exist."""
-    conn = sqlite3.connect('nisa_arena.db')
-    c = conn.cursor()
-    
-    # Check if we have any prompts
-    c.execute('SELECT COUNT(*) FROM prompts')
-    count = c.fetchone()[0]
-    
-    if count == 0:
-        # Insert default prompts
-        for prompt in DEFAULT_PROMPTS:
-            c.execute('INSERT INTO prompts (id, name, prompt, active) VALUES (?, ?, ?, ?)',
-                     (prompt['id'], prompt['name'], prompt['prompt'], 1))
-        conn.commit()
-        prompts = [dict(prompt, active=True) for prompt in DEFAULT_PROMPTS]
-    else:
-        # Load existing prompts
-        c.execute('SELECT id, name, prompt, active FROM prompts')
-        prompts = [{'id': row[0], 'name': row[1], 'prompt': row[2], 'active': bool(row[3])} for row in c.fetchall()]
-    
-    conn.close()
-    return prompts
-
-def load_active_prompts() -> List[Dict[str, str]]:
-    """Load only active system prompts from database."""
-    conn = sqlite3.connect('nisa_arena.db')
-    c = conn.cursor()
-    
-    c.execute('SELECT id, name, prompt FROM prompts WHERE active = 1')
-    prompts = [{'id': row[0], 'name': row[1], 'prompt': row[2]} for row in c.fetchall()]
-    
-    conn.close()
-    return prompts
-
-def save_system_prompts(prompts: List[Dict[str, str]]) -> None:
-    """Save system prompts to database."""
-    conn = sqlite3.connect('nisa_arena.db')
-    c = conn.cursor()
-    
-    # Clear existing prompts
-    c.execute('DELETE FROM prompts')
-    
-    # Insert new prompts
-    for prompt in prompts:
-        active = prompt.get('active', True)  # Default to active if not specified
-        c.execute('INSERT INTO prompts (id, name, prompt, active) VALUES (?, ?, ?, ?)',
-                 (prompt['id'], prompt['name'], prompt['prompt'], int(active)))
-    
-    conn.commit()
-    conn.close()
-
-def save_vote(conversation: List[Dict], left_config: Dict, right_config: Dict, winner: str) -> None:
-    """Save voting data to database."""
-    conn = sqlite3.connect('nisa_arena.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO votes (timestamp, conversation, left_config, right_config, winner)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        datetime.utcnow().isoformat(),
-        json.dumps(conversation),
-        json.dumps(left_config),
-        json.dumps(right_config),
-        winner
-    ))
-    
-    conn.commit()
-    conn.close()
-
-# Initialize database on startup
+# Initialize database on startup, then replay any votes a crash left in the spill log
 init_db()
+get_vote_writer()
 
 # with open('data/system_prompts.json', 'r') as f:
 #     existing_prompts = json.load(f)
@@ -169,70 +57,25 @@ def verify_password(password: str) -> bool:
     return password == SETTINGS_PASSWORD
 
 
-def file_to_data_url(file) -> str:
-    """Convert an uploaded image file to a base64 data URL."""
-    mime = mimetypes.guess_type(file.name)[0] or "image/png"
-    b64 = base64.b64encode(file.read()).decode()
-    return f"data:{mime};base64,{b64}"
+def show_latency_summary(turn_stats: List[Dict]) -> None:
+    """Show average time-to-first-token and total latency per side."""
+    if not turn_stats:
+        return
+    for side, label in (("left", "nisa A"), ("right", "nisa B")):
+        ttfts = [t[side]["ttft"] for t in turn_stats if t[side]["ttft"] is not None]
+        totals = [t[side]["total"] for t in turn_stats if t[side]["total"] is not None]
+        avg_ttft = sum(ttfts) / len(ttfts) if ttfts else float("nan")
+        avg_total = sum(totals) / len(totals) if totals else float("nan")
+        st.caption(f"{label}: first token {avg_ttft:.2f}s · full reply {avg_total:.2f}s (avg over {len(turn_stats)} turns)")
 
 
-def stream_chat_completion(model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 1000):
-    """Stream chat completion from OpenAI."""
-    try:
-        stream = openai.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=True
-        )
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
-    except Exception as e:
-        yield f"Error: {str(e)}"
-
-
-def format_response_with_tags(response: str) -> str:
-    """Format response to style inner monologue and output sections."""
-    import re
-    
-    # Replace <innermonologue> tags with styled content
-    def replace_inner_monologue(match):
-        content = match.group(1).strip()
-        # Use markdown formatting instead of HTML
-        return f'\n**Inner monologue:**\n*{content}*\n'
-    
-    # Replace <output> tags with styled content
-    def replace_output(match):
-        content = match.group(1).strip()
-        # Use markdown formatting with clear separation
-        return f'\n**Final response:**\n\n**{content}**\n'
-    
-    # Apply replacements
-    formatted = response
-    
-    # Handle inner monologue tags (case insensitive)
-    formatted = re.sub(
-        r'<innermonologue>(.*?)</innermonologue>', 
-        replace_inner_monologue, 
-        formatted, 
-        flags=re.DOTALL | re.IGNORECASE
-    )
-    
-    # Handle output tags (case insensitive)
-    formatted = re.sub(
-        r'<output>(.*?)</output>', 
-        replace_output, 
-        formatted, 
-        flags=re.DOTALL | re.IGNORECASE
-    )
-    
-    # If no tags were found, return the original response
-    if formatted == response:
-        return response
-    
-    return formatted
+def render_transcript(turns: List[Dict], side: str) -> None:
+    """Render pre-formatted head-to-head turns for one side."""
+    for turn in turns:
+        with st.chat_message("user"):
+            st.write(turn["user"])
+        with st.chat_message("assistant"):
+            st.write(turn[side])
 
 
 # -----------------------------------------------------------------------------
@@ -545,6 +388,16 @@ if "messages_right" not in st.session_state:
 if "conversation_history" not in st.session_state:
     st.session_state.conversation_history = []
 
+if "turn_stats" not in st.session_state:
+    st.session_state.turn_stats = []
+
+if "rendered_transcript" not in st.session_state:
+    st.session_state.rendered_transcript = RenderedTranscript()
+
+if "history_windows" not in st.session_state:
+    # Token counts per history, so each turn only counts its new messages
+    st.session_state.history_windows = {side: HistoryWindow() for side in ("single", "left", "right")}
+
 if "voting_phase" not in st.session_state:
     st.session_state.voting_phase = False
 
@@ -582,89 +435,130 @@ if st.session_state.show_settings:
         else:
             st.success("Settings unlocked!")
             
-            # Load current prompts
-            prompts = load_system_prompts()
+            prompts_tab, leaderboard_tab, cache_tab = st.tabs(["Prompts", "Leaderboard", "Prompt cache"])
+
+            with prompts_tab:
+                # Load current prompts
+                prompts = load_system_prompts()
+                version_counts = load_prompt_version_counts()
             
-            st.subheader("System Prompts")
-            st.markdown("land on a good prompt? want to test an existing one? use this [sheet](https://docs.google.com/spreadsheets/d/1UlNmas25Y0yEwp_1iVowUwH6od5zvSeZYYdzLlKjH1c/edit?gid=0#gid=0).") 
+                st.subheader("System Prompts")
+                st.markdown("land on a good prompt? want to test an existing one? use this [sheet](https://docs.google.com/spreadsheets/d/1UlNmas25Y0yEwp_1iVowUwH6od5zvSeZYYdzLlKjH1c/edit?gid=0#gid=0).") 
             
-            # Display and edit existing prompts
-            updated_prompts = []
-            for i, prompt in enumerate(prompts):
-                # Style based on active status
-                status_emoji = "✅" if prompt.get('active', True) else "❌"
-                header_text = f"{status_emoji} {prompt['name']} ({prompt['id']})"
+                # Display and edit existing prompts
+                updated_prompts = []
+                for i, prompt in enumerate(prompts):
+                    # Style based on active status
+                    status_emoji = "✅" if prompt.get('active', True) else "❌"
+                    header_text = f"{status_emoji} {prompt['name']} ({prompt['id']})"
                 
-                with st.expander(header_text):
-                    # Active/Inactive toggle
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.write(f"**Status:** {'Active' if prompt.get('active', True) else 'Inactive'}")
-                    with col2:
-                        if prompt.get('active', True):
-                            if st.button("Deactivate", key=f"deactivate_{i}"):
-                                prompt['active'] = False
-                                save_system_prompts(prompts)
-                                st.rerun()
-                        else:
-                            if st.button("Activate", key=f"activate_{i}"):
-                                prompt['active'] = True
-                                save_system_prompts(prompts)
-                                st.rerun()
-                    
-                    name = st.text_input("Name", value=prompt['name'], key=f"name_{i}")
-                    prompt_text = st.text_area("Prompt", value=prompt['prompt'], key=f"prompt_{i}", height=100)
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("Update", key=f"update_{i}"):
-                            prompt['name'] = name
-                            prompt['prompt'] = prompt_text
-                            st.success("Updated!")
+                    with st.expander(header_text):
+                        # Active/Inactive toggle
+                        col1, col2 = st.columns([3, 1])
+                        with col1:
+                            st.write(f"**Status:** {'Active' if prompt.get('active', True) else 'Inactive'}")
+                            # Saving edited text adds a version; votes keep pointing at theirs
+                            earlier = version_counts.get(prompt['id'], 1) - 1
+                            st.caption(f"Version {prompt['version'][:8]} · {earlier} earlier version{'s' if earlier != 1 else ''} kept")
+                        with col2:
+                            if prompt.get('active', True):
+                                if st.button("Deactivate", key=f"deactivate_{i}"):
+                                    prompt['active'] = False
+                                    save_system_prompts(prompts)
+                                    st.rerun()
+                            else:
+                                if st.button("Activate", key=f"activate_{i}"):
+                                    prompt['active'] = True
+                                    save_system_prompts(prompts)
+                                    st.rerun()
                     
-                    with col2:
-                        if st.button("Delete", key=f"delete_{i}"):
-                            st.session_state[f"confirm_delete_{i}"] = True
+                        name = st.text_input("Name", value=prompt['name'], key=f"name_{i}")
+                        prompt_text = st.text_area("Prompt", value=prompt['prompt'], key=f"prompt_{i}", height=100)
                     
-                    if st.session_state.get(f"confirm_delete_{i}", False):
-                        st.warning("Are you sure you want to delete this prompt?")
                         col1, col2 = st.columns(2)
                         with col1:
-                            if st.button("Yes, delete", key=f"confirm_yes_{i}"):
-                                continue  # Skip adding this prompt to updated_prompts
+                            if st.button("Update", key=f"update_{i}"):
+                                prompt['name'] = name
+                                prompt['prompt'] = prompt_text
+                                st.success("Updated!")
+                    
                         with col2:
-                            if st.button("Cancel", key=f"confirm_no_{i}"):
-                                st.session_state[f"confirm_delete_{i}"] = False
+                            if st.button("Delete", key=f"delete_{i}"):
+                                st.session_state[f"confirm_delete_{i}"] = True
+                    
+                        if st.session_state.get(f"confirm_delete_{i}", False):
+                            st.warning("Are you sure you want to delete this prompt?")
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                if st.button("Yes, delete", key=f"confirm_yes_{i}"):
+                                    continue  # Skip adding this prompt to updated_prompts
+                            with col2:
+                                if st.button("Cancel", key=f"confirm_no_{i}"):
+                                    st.session_state[f"confirm_delete_{i}"] = False
                     
-                    if not st.session_state.get(f"confirm_delete_{i}", False):
-                        updated_prompts.append({
-                            "id": prompt['id'],
-                            "name": name,
-                            "prompt": prompt_text,
-                            "active": prompt.get('active', True)
-                        })
+                        if not st.session_state.get(f"confirm_delete_{i}", False):
+                            updated_prompts.append({
+                                "id": prompt['id'],
+                                "name": name,
+                                "prompt": prompt_text,
+                                "active": prompt.get('active', True)
+                            })
             
-            # Add new prompt
-            st.subheader("Add New Prompt")
-            new_name = st.text_input("New prompt name")
-            new_prompt = st.text_area("New prompt text", height=100)
-            if st.button("Add Prompt") and new_name and new_prompt:
-                new_id = new_name.lower().replace(" ", "_")
-                updated_prompts.append({
-                    "id": new_id,
-                    "name": new_name,
-                    "prompt": new_prompt
-                })
-                save_system_prompts(updated_prompts)
-                st.success("Prompt added!")
-                st.rerun()
+                # Add new prompt
+                st.subheader("Add New Prompt")
+                new_name = st.text_input("New prompt name")
+                # Sections shared with the fragment library are stored once
+                library = load_fragment_library()
+                fragment_names = st.multiselect("Start from fragments", list(library))
+                new_prompt = st.text_area(
+                    "New prompt text",
+                    value="".join(library[name] for name in fragment_names),
+                    height=100
+                )
+                if st.button("Add Prompt") and new_name and new_prompt:
+                    new_id = new_name.lower().replace(" ", "_")
+                    updated_prompts.append({
+                        "id": new_id,
+                        "name": new_name,
+                        "prompt": new_prompt
+                    })
+                    save_system_prompts(updated_prompts)
+                    st.success("Prompt added!")
+                    st.rerun()
             
-            # Save all changes
-            if st.button("Save All Changes", type="primary"):
-                save_system_prompts(updated_prompts)
-                st.success("All changes saved!")
-                st.rerun()
+                # Save all changes
+                if st.button("Save All Changes", type="primary"):
+                    save_system_prompts(updated_prompts)
+                    st.success("All changes saved!")
+                    st.rerun()
             
+            with leaderboard_tab:
+                scope = st.radio("Rank by", SCOPES, horizontal=True, format_func=str.capitalize)
+                new_votes = leaderboard.update()
+                if new_votes:
+                    st.caption(f"Folded in {new_votes} new votes")
+
+                refit = st.button("Refit Bradley-Terry")
+                st.markdown("**Bradley-Terry** (95% bootstrap CI)")
+                st.dataframe(leaderboard.bradley_terry(scope, force=refit), hide_index=True)
+                st.markdown("**Online Elo**")
+                st.dataframe(leaderboard.elo(scope), hide_index=True)
+
+            with cache_tab:
+                # Since this process started; prompts under 1024 tokens are never cached
+                names = {p["version"]: p["name"] for p in load_system_prompts()}
+                rows = cache_stats.snapshot()
+                if not rows:
+                    st.caption("No requests yet")
+                for row in rows:
+                    row["prompt"] = names.get(row.pop("prompt_version"), "(other)")
+                st.dataframe(
+                    rows,
+                    hide_index=True,
+                    column_order=["prompt", "model", "requests", "prompt_tokens", "cached_tokens", "hit_rate", "cacheable"],
+                    column_config={"hit_rate": st.column_config.ProgressColumn("hit rate", min_value=0.0, max_value=1.0)},
+                )
+
             if st.button("Lock Settings"):
                 st.session_state.authenticated_settings = False
                 st.session_state.show_settings = False
@@ -709,26 +603,16 @@ if not st.session_state.conversation_started:
             # Initialize head-to-head configurations
             prompts = load_active_prompts()  # Use only active prompts
             
-            # Randomly select models and prompts
-            left_model = random.choice(MODELS)
-            right_model = random.choice(MODELS)
-            left_prompt = random.choice(prompts)
-            right_prompt = random.choice(prompts)
-            
-            st.session_state.left_config = {
-                "model": left_model,
-                "prompt": left_prompt
-            }
-            st.session_state.right_config = {
-                "model": right_model,
-                "prompt": right_prompt
-            }
+            # Pick the most informative distinct pair; sides stay blind
+            left_config, right_config = choose_pair(MODELS, prompts)
+            st.session_state.left_config = left_config
+            st.session_state.right_config = right_config
             
             st.session_state.messages_left = [
-                {"role": "system", "content": left_prompt["prompt"]}
+                {"role": "system", "content": left_config["prompt"]["prompt"]}
             ]
             st.session_state.messages_right = [
-                {"role": "system", "content": right_prompt["prompt"]}
+                {"role": "system", "content": right_config["prompt"]["prompt"]}
             ]
             st.rerun()
 
@@ -803,14 +687,13 @@ elif st.session_state.chat_mode == "single":
             # Prepare message content
             content = [{"type": "text", "text": user_input}]
             for file in uploaded_files or []:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": file_to_data_url(file)}
-                })
+                content.append(image_part(file))
             
             # Add user message
             user_msg = {"role": "user", "content": content if len(content) > 1 else user_input}
             st.session_state.messages.append(user_msg)
+            if uploaded_files:
+                show_image_savings(st.session_state.messages)
             
             # Display the new user message and assistant response in the chat container
             with chat_container:
@@ -819,23 +702,31 @@ elif st.session_state.chat_mode == "single":
                 
                 with st.chat_message("assistant"):
                     response_placeholder = st.empty()
-                    response = ""
+                    renderer = RenderScheduler(response_placeholder)
+                    # Formats the tags as tokens land, so raw tags never flash up
+                    formatter = StreamingTagFormatter()
                     
-                    for chunk in stream_chat_completion(
-                        st.session_state.current_config["model"]["id"],
-                        st.session_state.messages
-                    ):
-                        response += chunk
-                        response_placeholder.markdown(response + "▌")
+                    try:
+                        for chunk in stream_chat_completion(
+                            st.session_state.current_config["model"]["id"],
+                            st.session_state.messages,
+                            window=st.session_state.history_windows["single"]
+                        ):
+                            formatter.feed(chunk)
+                            renderer.update(formatter)
+                    except CompletionError as e:
+                        # Leave the history as it was before this message
+                        st.session_state.messages.pop()
+                        response_placeholder.empty()
+                        st.error(f"{e}. Your message wasn't sent, please try again.")
+                        st.stop()
                     
-                    response_placeholder.markdown(response)
+                    renderer.finish(formatter.finish())
+                    response = formatter.raw.getvalue()
                     
                     # Add assistant response to messages
                     st.session_state.messages.append({"role": "assistant", "content": response})
             
-            # After streaming is complete, display the formatted version
-            response_placeholder.write(format_response_with_tags(response))
-            
             st.rerun()
         
         if new_chat:
@@ -850,11 +741,15 @@ elif st.session_state.chat_mode == "head2head":
         st.session_state.messages_left = []
         st.session_state.messages_right = []
         st.session_state.conversation_history = []
+        st.session_state.turn_stats = []
         st.session_state.voting_phase = False
         st.session_state.left_config = None
         st.session_state.right_config = None
         st.rerun()
     
+    # Formatted once per turn and shared by the chat and voting screens
+    transcript_turns = st.session_state.rendered_transcript.sync(st.session_state.conversation_history)
+    
     # Head-to-head interface (existing code)
     if not st.session_state.voting_phase:
         # Chat interface
@@ -865,21 +760,13 @@ elif st.session_state.chat_mode == "head2head":
             st.subheader("nisa A")
             left_chat_container = st.container()
             with left_chat_container:
-                for msg in st.session_state.conversation_history:
-                    with st.chat_message("user"):
-                        st.write(msg["user"])
-                    with st.chat_message("assistant"):
-                        st.write(format_response_with_tags(msg["left"]))
+                render_transcript(transcript_turns, "left")
         
         with right_col:
             st.subheader("nisa B")
             right_chat_container = st.container()
             with right_chat_container:
-                for msg in st.session_state.conversation_history:
-                    with st.chat_message("user"):
-                        st.write(msg["user"])
-                    with st.chat_message("assistant"):
-                        st.write(format_response_with_tags(msg["right"]))
+                render_transcript(transcript_turns, "right")
         
         # Input form
         with st.form("chat_input", clear_on_submit=True):
@@ -900,19 +787,14 @@ elif st.session_state.chat_mode == "head2head":
             # Prepare message content
             content = [{"type": "text", "text": user_input}]
             for file in uploaded_files or []:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": file_to_data_url(file)}
-                })
+                content.append(image_part(file))
             
             # Add user message to both conversations
             user_msg = {"role": "user", "content": content if len(content) > 1 else user_input}
             st.session_state.messages_left.append(user_msg)
             st.session_state.messages_right.append(user_msg)
-            
-            # Get responses
-            left_response = ""
-            right_response = ""
+            if uploaded_files:
+                show_image_savings(st.session_state.messages_left)
             
             # Display in the existing chat containers
             with left_chat_container:
@@ -927,44 +809,54 @@ elif st.session_state.chat_mode == "head2head":
                 with st.chat_message("assistant"):
                     right_placeholder = st.empty()
             
-            # Create streaming generators
-            left_stream = stream_chat_completion(
-                st.session_state.left_config["model"]["id"],
-                st.session_state.messages_left
-            )
-            right_stream = stream_chat_completion(
-                st.session_state.right_config["model"]["id"],
-                st.session_state.messages_right
-            )
+            # Stream both sides concurrently; each placeholder updates as soon
+            # as its own tokens arrive.
+            renderers = {
+                "left": RenderScheduler(left_placeholder),
+                "right": RenderScheduler(right_placeholder),
+            }
+            formatters = {"left": StreamingTagFormatter(), "right": StreamingTagFormatter()}
+            streams = ConcurrentStreams({
+                "left": stream_chat_completion(
+                    st.session_state.left_config["model"]["id"],
+                    st.session_state.messages_left,
+                    window=st.session_state.history_windows["left"]
+                ),
+                "right": stream_chat_completion(
+                    st.session_state.right_config["model"]["id"],
+                    st.session_state.messages_right,
+                    window=st.session_state.history_windows["right"]
+                ),
+            }, raise_errors=False)
             
-            # Stream both responses in an interleaved fashion
-            left_done = False
-            right_done = False
+            formatted = {}
+            for side, chunk in streams:
+                if chunk is None:
+                    formatted[side] = formatters[side].finish()
+                    renderers[side].finish(formatted[side])
+                else:
+                    formatters[side].feed(chunk)
+                    renderers[side].update(formatters[side])
             
-            while not (left_done and right_done):
-                # Process left stream
-                if not left_done:
-                    try:
-                        chunk = next(left_stream)
-                        left_response += chunk
-                        left_placeholder.markdown(left_response + "▌")
-                    except StopIteration:
-                        left_done = True
-                        left_placeholder.markdown(left_response)
-                
-                # Process right stream
-                if not right_done:
-                    try:
-                        chunk = next(right_stream)
-                        right_response += chunk
-                        right_placeholder.markdown(right_response + "▌")
-                    except StopIteration:
-                        right_done = True
-                        right_placeholder.markdown(right_response)
+            if streams.errors:
+                # A turn only counts if both sides answered: drop it from both
+                # histories so the two conversations stay comparable
+                st.session_state.messages_left.pop()
+                st.session_state.messages_right.pop()
+                left_placeholder.empty()
+                right_placeholder.empty()
+                # Error text names the model, which would unblind the duel
+                failed = " and ".join("nisa A" if side == "left" else "nisa B" for side in sorted(streams.errors))
+                st.error(f"{failed} couldn't answer just now. Your message wasn't sent, please try again.")
+                st.stop()
             
-            # After streaming is complete, display formatted versions
-            left_placeholder.write(format_response_with_tags(left_response))
-            right_placeholder.write(format_response_with_tags(right_response))
+            left_response = formatters["left"].raw.getvalue()
+            right_response = formatters["right"].raw.getvalue()
+            
+            # Per-side latency, kept out of the blind UI and revealed after voting
+            st.session_state.turn_stats.append({
+                side: stats.as_dict() for side, stats in streams.stats.items()
+            })
             
             # Add assistant responses
             st.session_state.messages_left.append({"role": "assistant", "content": left_response})
@@ -976,6 +868,7 @@ elif st.session_state.chat_mode == "head2head":
                 "left": left_response,
                 "right": right_response
             })
+            st.session_state.rendered_transcript.add(user_input, formatted["left"], formatted["right"])
             
             st.rerun()
         
@@ -1001,11 +894,7 @@ elif st.session_state.chat_mode == "head2head":
                 <h2 style="text-align: center; margin-bottom: 20px;">nisa A</h2>
             </div>
             """, unsafe_allow_html=True)
-            for msg in st.session_state.conversation_history:
-                with st.chat_message("user"):
-                    st.write(msg["user"])
-                with st.chat_message("assistant"):
-                    st.write(format_response_with_tags(msg["left"]))
+            render_transcript(transcript_turns, "left")
         
         with right_col:
             st.markdown("""
@@ -1013,11 +902,7 @@ elif st.session_state.chat_mode == "head2head":
                 <h2 style="text-align: center; margin-bottom: 20px;">nisa B</h2>
             </div>
             """, unsafe_allow_html=True)
-            for msg in st.session_state.conversation_history:
-                with st.chat_message("user"):
-                    st.write(msg["user"])
-                with st.chat_message("assistant"):
-                    st.write(format_response_with_tags(msg["right"]))
+            render_transcript(transcript_turns, "right")
         
         # Voting buttons
         st.markdown("---")
@@ -1036,7 +921,7 @@ elif st.session_state.chat_mode == "head2head":
             </div>
             """, unsafe_allow_html=True)
             if st.button("NISA A WINS", type="primary", use_container_width=True):
-                save_vote(
+                submit_vote(
                     st.session_state.conversation_history,
                     st.session_state.left_config,
                     st.session_state.right_config,
@@ -1046,6 +931,7 @@ elif st.session_state.chat_mode == "head2head":
                 st.success("Vote recorded! Thank you!")
                 st.info(f"nisa A was: {st.session_state.left_config['model']['name']} with {st.session_state.left_config['prompt']['name']}")
                 st.info(f"nisa B was: {st.session_state.right_config['model']['name']} with {st.session_state.right_config['prompt']['name']}")
+                show_latency_summary(st.session_state.turn_stats)
         
         with col2:
             st.markdown("""
@@ -1054,7 +940,7 @@ elif st.session_state.chat_mode == "head2head":
             </div>
             """, unsafe_allow_html=True)
             if st.button("NISA B WINS", type="primary", use_container_width=True):
-                save_vote(
+                submit_vote(
                     st.session_state.conversation_history,
                     st.session_state.left_config,
                     st.session_state.right_config,
@@ -1064,6 +950,7 @@ elif st.session_state.chat_mode == "head2head":
                 st.success("Vote recorded! Thank you!")
                 st.info(f"nisa A was: {st.session_state.left_config['model']['name']} with {st.session_state.left_config['prompt']['name']}")
                 st.info(f"nisa B was: {st.session_state.right_config['model']['name']} with {st.session_state.right_config['prompt']['name']}")
+                show_latency_summary(st.session_state.turn_stats)
         
         with col3:
             st.markdown("""
@@ -1072,7 +959,7 @@ elif st.session_state.chat_mode == "head2head":
             </div>
             """, unsafe_allow_html=True)
             if st.button("IT'S A TIE", use_container_width=True):
-                save_vote(
+                submit_vote(
                     st.session_state.conversation_history,
                     st.session_state.left_config,
                     st.session_state.right_config,
@@ -1081,6 +968,7 @@ elif st.session_state.chat_mode == "head2head":
                 st.success("Vote recorded! Thank you!")
                 st.info(f"nisa A was: {st.session_state.left_config['model']['name']} with {st.session_state.left_config['prompt']['name']}")
                 st.info(f"nisa B was: {st.session_state.right_config['model']['name']} with {st.session_state.right_config['prompt']['name']}")
+                show_latency_summary(st.session_state.turn_stats)
         
         st.markdown("<br><br>", unsafe_allow_html=True)
         if st.button("NEW PAIRING", use_container_width=True):
@@ -1089,30 +977,21 @@ elif st.session_state.chat_mode == "head2head":
             st.session_state.messages_left = []
             st.session_state.messages_right = []
             st.session_state.conversation_history = []
+            st.session_state.turn_stats = []
             
             # Initialize new head-to-head configurations
             prompts = load_active_prompts()
             
-            # Randomly select models and prompts
-            left_model = random.choice(MODELS)
-            right_model = random.choice(MODELS)
-            left_prompt = random.choice(prompts)
-            right_prompt = random.choice(prompts)
-            
-            st.session_state.left_config = {
-                "model": left_model,
-                "prompt": left_prompt
-            }
-            st.session_state.right_config = {
-                "model": right_model,
-                "prompt": right_prompt
-            }
+            # Pick the most informative distinct pair; sides stay blind
+            left_config, right_config = choose_pair(MODELS, prompts)
+            st.session_state.left_config = left_config
+            st.session_state.right_config = right_config
             
             st.session_state.messages_left = [
-                {"role": "system", "content": left_prompt["prompt"]}
+                {"role": "system", "content": left_config["prompt"]["prompt"]}
             ]
             st.session_state.messages_right = [
-                {"role": "system", "content": right_prompt["prompt"]}
+                {"role": "system", "content": right_config["prompt"]["prompt"]}
             ]
             
             st.rerun() 
\ No newline at end of file
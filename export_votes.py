@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Export head-to-head votes as one record per conversation turn.
+
+Rows are streamed from SQLite with fetchmany() and written chunk by chunk,
+so memory use stays flat however large nisa_arena.db gets. Output is
+Parquet (one row group per chunk) or Arrow IPC when pyarrow is installed,
+and newline-delimited JSON otherwise.
+
+Each run writes one file named votes_<first id>_<last id>.<ext> into the
+output directory. By default only votes newer than the highest id already
+exported there are written, so repeated runs are incremental; pass
+--full to export everything again.
+
+The database is opened read-only and never migrated; a database the app
+has not yet converted to the normalized vote tables is refused.
+
+Usage: python export_votes.py [--db nisa_arena.db] [--out exports] [--format parquet|arrow|ndjson] [--full]
+"""
+
+import os
+import re
+import json
+import argparse
+from typing import List, Dict, Iterator, Optional
+
+import arena_db
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional; without it we write NDJSON
+    pa = None
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+CHUNK_ROWS = 2000
+
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "ndjson": ".ndjson"}
+FILE_PATTERN = re.compile(r"^votes_(\d+)_(\d+)\.(parquet|arrow|ndjson)$")
+
+REQUIRED_TABLES = ("votes", "turns", "configs", "prompt_versions")
+
+# Stored winners are 'a'/'b'/'tie'; export the app's left/right/tie
+WINNER_NAMES = {stored: name for name, stored in arena_db.WINNERS.items()}
+
+COLUMNS = [
+    "vote_id", "ts", "winner", "turn", "user", "left", "right",
+    "left_model_id", "left_model_name", "left_prompt_id", "left_prompt_name", "left_prompt_version",
+    "right_model_id", "right_model_name", "right_prompt_id", "right_prompt_name", "right_prompt_version",
+]
+
+TURNS_QUERY = '''
+    SELECT v.id, v.ts, v.winner, t.idx, t.user, t.left, t.right,
+           ca.model_id, ca.model_name, ca.prompt_id, pa.name, ca.prompt_version,
+           cb.model_id, cb.model_name, cb.prompt_id, pb.name, cb.prompt_version
+    FROM votes v
+    JOIN turns t ON t.vote_id = v.id
+    JOIN configs ca ON ca.id = v.config_a
+    JOIN configs cb ON cb.id = v.config_b
+    JOIN prompt_versions pa ON pa.prompt_id = ca.prompt_id AND pa.version = ca.prompt_version
+    JOIN prompt_versions pb ON pb.prompt_id = cb.prompt_id AND pb.version = cb.prompt_version
+    WHERE v.id > ? AND v.id <= ?
+    ORDER BY v.id, t.idx
+'''
+
+# -----------------------------------------------------------------------------
+# Reading
+# -----------------------------------------------------------------------------
+
+def missing_tables(conn) -> List[str]:
+    """Tables (or columns) TURNS_QUERY needs that the database lacks."""
+    missing = [
+        table for table in REQUIRED_TABLES
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    ]
+    if "votes" not in missing:
+        columns = {column[1] for column in conn.execute("PRAGMA table_info(votes)")}
+        if "config_a" not in columns:
+            missing.append("votes.config_a")
+    return missing
+
+
+def last_exported_id(out_dir: str) -> int:
+    """Highest vote id already present in an export directory."""
+    if not os.path.isdir(out_dir):
+        return 0
+    ids = [int(m.group(2)) for m in map(FILE_PATTERN.match, os.listdir(out_dir)) if m]
+    return max(ids, default=0)
+
+
+def iter_turn_chunks(since_id: int, until_id: int, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[Dict]]:
+    """Yield lists of per-turn records for votes in (since_id, until_id]."""
+    cur = arena_db.connection().execute(TURNS_QUERY, (since_id, until_id))
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        chunk = []
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            record["winner"] = WINNER_NAMES[record["winner"]]
+            chunk.append(record)
+        yield chunk
+
+# -----------------------------------------------------------------------------
+# Writers
+# -----------------------------------------------------------------------------
+
+class NDJSONWriter:
+    def __init__(self, path: str):
+        self._file = open(path, "w")
+
+    def write(self, chunk: List[Dict]) -> None:
+        self._file.writelines(json.dumps(record) + "\n" for record in chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC file, one row group / record batch per chunk."""
+
+    def __init__(self, path: str, fmt: str):
+        self.schema = pa.schema(
+            [(name, pa.int64() if name in ("vote_id", "turn") else pa.string()) for name in COLUMNS]
+        )
+        if fmt == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self._writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, chunk: List[Dict]) -> None:
+        self._writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+# -----------------------------------------------------------------------------
+# Export
+# -----------------------------------------------------------------------------
+
+def export_votes(out_dir: str, fmt: str = "parquet", since_id: Optional[int] = None,
+                 chunk_rows: int = CHUNK_ROWS) -> Optional[str]:
+    """Write votes newer than `since_id` (default: the last export) to out_dir.
+
+    Returns the path written, or None when there was nothing new.
+    """
+    if fmt != "ndjson" and pa is None:
+        fmt = "ndjson"
+    if since_id is None:
+        since_id = last_exported_id(out_dir)
+
+    # One read transaction: a consistent snapshot while the app keeps writing
+    with arena_db.transaction():
+        conn = arena_db.connection()
+        until_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM votes').fetchone()[0]
+        first_id = conn.execute('SELECT MIN(id) FROM votes WHERE id > ?', (since_id,)).fetchone()[0]
+        if first_id is None:
+            return None
+
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"votes_{first_id}_{until_id}{EXTENSIONS[fmt]}")
+        tmp = path + ".tmp"
+        writer = NDJSONWriter(tmp) if fmt == "ndjson" else ArrowWriter(tmp, fmt)
+        try:
+            for chunk in iter_turn_chunks(since_id, until_id, chunk_rows):
+                writer.write(chunk)
+        finally:
+            writer.close()
+
+    # Only a finished file gets a name the next incremental run will trust
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=arena_db.DB_PATH, help="database to export")
+    parser.add_argument("--out", default="exports", help="output directory")
+    parser.add_argument("--format", choices=list(EXTENSIONS), default="parquet")
+    parser.add_argument("--full", action="store_true", help="export all votes, not just new ones")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+    # Exporting never migrates or creates anything in the source database
+    arena_db.set_db_path(args.db, read_only=True)
+    missing = missing_tables(arena_db.connection())
+    if missing:
+        parser.error(f"{args.db} has no normalized vote schema (missing {', '.join(missing)}); "
+                     "start the app on it once to migrate, then export")
+    if arena_db.connection().execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'votes_legacy'"
+    ).fetchone():
+        print("⚠️ Legacy votes are still being migrated; only votes already moved are exported")
+    path = export_votes(args.out, args.format, since_id=0 if args.full else None, chunk_rows=args.chunk_rows)
+    if path is None:
+        print("✅ No new votes to export")
+    else:
+        print(f"✅ Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
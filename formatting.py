@@ -0,0 +1,236 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+from streaming import ResponseBuffer
+
+# -----------------------------------------------------------------------------
+# Tag formatting
+# -----------------------------------------------------------------------------
+
+# One pattern for both tags so a reply is scanned once. The backreference
+# makes the closing tag match the opening one (case-insensitively).
+TAG_PATTERN = re.compile(r'<(innermonologue|output)>(.*?)</\1>', re.DOTALL | re.IGNORECASE)
+
+FORMAT_CACHE_SIZE = 2048
+
+
+# Markdown wrapped around each block's content, shared by the one-shot and
+# streaming formatters so they always agree.
+BLOCK_MARKDOWN = {
+    # Use markdown formatting instead of HTML
+    'innermonologue': ('\n**Inner monologue:**\n*', '*\n'),
+    # Use markdown formatting with clear separation
+    'output': ('\n**Final response:**\n\n**', '**\n'),
+}
+
+
+def format_inner_monologue(content: str) -> str:
+    prefix, suffix = BLOCK_MARKDOWN['innermonologue']
+    return f'{prefix}{content}{suffix}'
+
+
+def format_output(content: str) -> str:
+    prefix, suffix = BLOCK_MARKDOWN['output']
+    return f'{prefix}{content}{suffix}'
+
+
+def _format_tags(text: str) -> str:
+    parts = []
+    pos = 0
+    for match in TAG_PATTERN.finditer(text):
+        parts.append(text[pos:match.start()])
+        tag, content = match.group(1).lower(), match.group(2)
+        # Tags nested inside a block get formatted too, as the old
+        # two-pass re.sub version did.
+        if tag == 'innermonologue':
+            parts.append(format_inner_monologue(_format_tags(content.strip())))
+        else:
+            parts.append(format_output(_format_tags(content).strip()))
+        pos = match.end()
+
+    if pos == 0:
+        return text
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_response_with_tags(response: str) -> str:
+    """Format response to style inner monologue and output sections.
+
+    Results are memoized per reply text, so history messages that did not
+    change since the last rerun are never re-parsed. The cache key is the
+    string itself; CPython stores a str's hash on the object, so repeated
+    lookups for the same session-state message are O(1).
+    """
+    return _format_tags(response)
+
+
+# -----------------------------------------------------------------------------
+# Streaming tag formatting
+# -----------------------------------------------------------------------------
+
+OPEN_TAGS = {f'<{tag}>': tag for tag in BLOCK_MARKDOWN}
+CLOSE_TAGS = {tag: f'</{tag}>' for tag in BLOCK_MARKDOWN}
+
+
+class StreamingTagFormatter:
+    """Format <innermonologue>/<output> replies chunk by chunk while streaming.
+
+    A small state machine tracks whether we are outside any tag or inside a
+    block, and turns each chunk into the same markdown format_response_with_tags
+    would produce for the finished reply. A trailing partial tag (say "</outp")
+    is held back until the next chunk decides what it is, and whitespace at
+    the edges of a block is dropped just like content.strip().
+
+    str() gives the markdown so far with the open block's emphasis closed, so
+    it renders cleanly mid-stream and can be handed straight to a
+    RenderScheduler. The raw reply is kept in `raw` for the message history.
+    """
+
+    def __init__(self):
+        self.raw = ResponseBuffer()
+        self._formatted = ResponseBuffer()
+        self._block: Optional[str] = None
+        self._carry = ''
+        self._block_has_text = False
+        self._held_whitespace = ''
+        # Nested or unclosed tags: let the one-shot formatter decide at the end
+        self.irregular = False
+
+    def _emit_text(self, text: str, out: list) -> None:
+        if not text:
+            return
+        if self._block is None:
+            out.append(text)
+            return
+
+        if not self._block_has_text:
+            text = text.lstrip()
+            if not text:
+                return
+            self._block_has_text = True
+        stripped = text.rstrip()
+        if stripped:
+            out.append(self._held_whitespace + stripped)
+            self._held_whitespace = text[len(stripped):]
+        else:
+            self._held_whitespace += text
+
+    def _open(self, tag: str, out: list) -> None:
+        self._block = tag
+        self._block_has_text = False
+        self._held_whitespace = ''
+        out.append(BLOCK_MARKDOWN[tag][0])
+
+    def _close(self, out: list) -> None:
+        out.append(BLOCK_MARKDOWN[self._block][1])
+        self._block = None
+        self._held_whitespace = ''
+
+    def feed(self, chunk: str) -> str:
+        """Consume one streamed chunk and return the markdown it produced."""
+        self.raw.append(chunk)
+        text = self._carry + chunk
+        self._carry = ''
+        out: list = []
+
+        pos = 0
+        while True:
+            lt = text.find('<', pos)
+            if lt == -1:
+                self._emit_text(text[pos:], out)
+                break
+            self._emit_text(text[pos:lt], out)
+
+            rest = text[lt:lt + 20].lower()
+            if self._block is None:
+                tags = OPEN_TAGS
+            else:
+                tags = {CLOSE_TAGS[self._block]: None, **OPEN_TAGS}
+
+            matched = partial = False
+            for tag, opens in tags.items():
+                if rest.startswith(tag):
+                    if self._block is None:
+                        self._open(opens, out)
+                    elif opens is None:
+                        self._close(out)
+                    else:
+                        # A block opened inside another block
+                        self.irregular = True
+                        self._emit_text(text[lt:lt + len(tag)], out)
+                    pos = lt + len(tag)
+                    matched = True
+                    break
+                if len(rest) < len(tag) and tag.startswith(rest):
+                    partial = True
+
+            if matched:
+                continue
+            if partial:
+                self._carry = text[lt:]
+                break
+            self._emit_text('<', out)
+            pos = lt + 1
+
+        fragment = ''.join(out)
+        self._formatted.append(fragment)
+        return fragment
+
+    def __len__(self) -> int:
+        closing = BLOCK_MARKDOWN[self._block][1] if self._block else ''
+        return len(self._formatted) + len(closing)
+
+    def __str__(self) -> str:
+        closing = BLOCK_MARKDOWN[self._block][1] if self._block else ''
+        return str(self._formatted) + closing
+
+    def finish(self) -> str:
+        """Flush any held-back text and return the final formatted reply."""
+        if self._carry:
+            carry, self._carry = self._carry, ''
+            out: list = []
+            self._emit_text(carry, out)
+            self._formatted.append(''.join(out))
+
+        if self.irregular or self._block is not None:
+            return format_response_with_tags(self.raw.getvalue())
+        return self._formatted.getvalue()
+
+
+# -----------------------------------------------------------------------------
+# Rendered transcript
+# -----------------------------------------------------------------------------
+
+class RenderedTranscript:
+    """Per-session cache of formatted head-to-head turns.
+
+    Holds one {"user", "left", "right"} dict of ready-to-render markdown per
+    turn of conversation_history. sync() only formats turns it has not seen
+    yet, and turns streamed this session can be added with their formatted
+    text directly, so the chat and vote screens never reformat history.
+    """
+
+    def __init__(self):
+        self.turns: list = []
+        self._source: Optional[list] = None
+
+    def add(self, user: str, left: str, right: str) -> None:
+        """Record an already-formatted turn."""
+        self.turns.append({"user": user, "left": left, "right": right})
+
+    def sync(self, history: list) -> list:
+        """Bring the cache in line with `history` and return the formatted turns."""
+        if history is not self._source or len(history) < len(self.turns):
+            # History was reset (back to menu, new pairing)
+            self.turns = []
+            self._source = history
+        for msg in history[len(self.turns):]:
+            self.add(
+                msg["user"],
+                format_response_with_tags(msg["left"]),
+                format_response_with_tags(msg["right"]),
+            )
+        return self.turns
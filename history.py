@@ -0,0 +1,169 @@
+import os
+import bisect
+import threading
+from typing import List, Dict, Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; without it token counts are estimated
+    tiktoken = None
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+# Most conversation tokens sent per request, system prompt included. Cost and
+# latency grow with every token re-sent each turn, so this sits well below
+# the models' context windows; it is capped by CONTEXT_WINDOWS regardless.
+HISTORY_TOKEN_BUDGET = int(os.getenv("NISA_HISTORY_TOKENS", "24000"))
+
+CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.5-preview": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 128000
+
+# When the window has to move, trim down to this share of the budget, so it
+# then stays put for several turns instead of sliding (and changing the
+# request prefix) on every one.
+TRIM_TO = 0.75
+
+ENCODING = "o200k_base"
+# Estimator used when tiktoken (or its encoding file) is unavailable. English
+# prose runs about 4 characters a token; nisa's tagged replies and prompts
+# run a little denser, so this errs towards overcounting.
+CHARS_PER_TOKEN = 3.5
+# Role and separator tokens OpenAI adds around every message
+MESSAGE_OVERHEAD = 4
+# An image at the store's preprocessed size: 85 base + 170 per 512px tile
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+
+# -----------------------------------------------------------------------------
+# Token counting
+# -----------------------------------------------------------------------------
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """Return the tiktoken encoding, or None to fall back to the estimator."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                if tiktoken is not None:
+                    try:
+                        _encoding = tiktoken.get_encoding(ENCODING)
+                    except Exception:  # the BPE file is downloaded on first use
+                        _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_text(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN + 0.5)
+
+
+def count_message(msg: Dict) -> int:
+    """Tokens one chat message costs in a request."""
+    content = msg.get("content")
+    tokens = MESSAGE_OVERHEAD
+    if isinstance(content, str):
+        return tokens + count_text(content)
+    for part in content or []:
+        if part.get("type") == "image_url":
+            tokens += IMAGE_TOKENS.get(part["image_url"].get("detail", "auto"), IMAGE_TOKENS["auto"])
+        else:
+            tokens += count_text(part.get("text", ""))
+    return tokens
+
+
+def count_messages(messages: List[Dict]) -> int:
+    return sum(count_message(msg) for msg in messages)
+
+
+def token_budget(model: str, max_tokens: int = 0) -> int:
+    """Prompt tokens a request to `model` may use, leaving room for the reply."""
+    context = CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return min(HISTORY_TOKEN_BUDGET, context - max_tokens)
+
+# -----------------------------------------------------------------------------
+# History windowing
+# -----------------------------------------------------------------------------
+
+class HistoryWindow:
+    """Per-history token counts and the part of the history that gets sent.
+
+    Keeps a running prefix sum of per-message token counts. sync() only
+    counts messages it has not seen, so a new turn costs the tokens of that
+    turn, not of the whole conversation. window() always keeps the leading
+    system messages and the newest turn, and drops the oldest whole turns
+    once the rest would go over budget.
+    """
+
+    def __init__(self):
+        self._messages: list = []
+        self._prefix: List[int] = [0]
+        self._source: Optional[list] = None
+        self._start = 0
+        self._system = 0
+
+    def sync(self, history: list) -> None:
+        """Bring the counts in line with `history`."""
+        if history is not self._source:
+            # History was reset (back to menu, new pairing)
+            self._source = history
+            self._messages = []
+            self._prefix = [0]
+            self._start = 0
+            self._system = 0
+        # Messages popped (a failed turn) or replaced since the last sync
+        keep = min(len(self._messages), len(history))
+        while keep and history[keep - 1] is not self._messages[keep - 1]:
+            keep -= 1
+        del self._messages[keep:]
+        del self._prefix[keep + 1:]
+        self._start = min(self._start, keep)
+        for msg in history[keep:]:
+            self._messages.append(msg)
+            self._prefix.append(self._prefix[-1] + count_message(msg))
+
+    @property
+    def total_tokens(self) -> int:
+        return self._prefix[-1]
+
+    @property
+    def window_tokens(self) -> int:
+        """Tokens of the messages the last window() call returned, from the prefix sums."""
+        return self._prefix[self._system] + self._prefix[-1] - self._prefix[self._start]
+
+    def window(self, history: list, budget: int) -> list:
+        """The messages to send: system prompt plus as many recent turns as fit."""
+        self.sync(history)
+        system = 0
+        while system < len(history) and history[system].get("role") == "system":
+            system += 1
+        self._system = system
+        self._start = max(self._start, system)
+
+        end = self._prefix[-1]
+        available = budget - self._prefix[system]
+        if end - self._prefix[self._start] > available:
+            # Earliest cut that brings the kept turns under TRIM_TO of the
+            # budget, moved forward to the start of a turn
+            target = end - int(available * TRIM_TO)
+            start = max(bisect.bisect_left(self._prefix, target), self._start)
+            while start < len(history) and history[start].get("role") != "user":
+                start += 1
+            if start >= len(history):
+                # Even the newest turn alone is over budget; send it anyway
+                start = max((i for i in range(system, len(history)) if history[i].get("role") == "user"),
+                            default=self._start)
+            self._start = start
+        return history[:system] + history[self._start:]
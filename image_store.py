@@ -0,0 +1,269 @@
+import io
+import os
+import base64
+import hashlib
+import mimetypes
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are stored as uploaded
+    Image = None
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+IMAGE_DIR = os.path.join("data", "images")
+
+# Message image URLs with this prefix point into the store instead of
+# carrying the image inline.
+REF_PREFIX = "imgstore:"
+
+# Data URLs kept ready for the images most recently sent to the API, by
+# total size: a preprocessed photo is a few hundred KB, a PNG screenshot
+# can be several MB
+DATA_URL_CACHE_BYTES = 32 * 1024 * 1024
+# Upload sizes remembered in memory for savings reports; the alias files
+# keep them for good
+ORIGINAL_SIZES_CACHE = 1024
+
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif", "image/webp": ".webp"}
+
+# Preprocessing before upload. OpenAI scales high-detail images to fit
+# 2048x2048 and then to 768px on the short side, so anything beyond that is
+# bandwidth and request size we pay for and the model never sees.
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 85
+IMAGE_DETAIL = "auto"  # "low", "high" or "auto"; low-detail images are capped at 512px
+LOW_DETAIL_SIDE = 512
+
+# -----------------------------------------------------------------------------
+# Image store
+# -----------------------------------------------------------------------------
+
+class ImageStore:
+    """Content-addressed image files on disk, keyed by SHA-256.
+
+    Session state and message histories only hold short "imgstore:<hash>.<ext>"
+    references; identical uploads from any session share one file. Data URLs
+    are built only when a request payload is assembled.
+    """
+
+    def __init__(self, root: str = IMAGE_DIR, cache_bytes: int = DATA_URL_CACHE_BYTES,
+                 sizes_cache: int = ORIGINAL_SIZES_CACHE):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self.sizes_cache = sizes_cache
+        self._data_urls: "OrderedDict[str, str]" = OrderedDict()
+        self._data_url_bytes = 0
+        self._lock = threading.Lock()
+        # ref -> size of the upload it was made from, for savings reports
+        self._original_sizes: "OrderedDict[str, int]" = OrderedDict()
+
+    def path(self, ref: str) -> str:
+        name = ref[len(REF_PREFIX):]
+        if os.sep in name or "/" in name or name.startswith("."):
+            raise ValueError(f"Invalid image reference: {ref}")
+        return os.path.join(self.root, name[:2], name)
+
+    def put(self, data: bytes, mime: str = "image/png") -> str:
+        """Store image bytes (once) and return their reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        ref = f"{REF_PREFIX}{digest}{EXTENSIONS.get(mime, '.png')}"
+        path = self.path(ref)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+        return ref
+
+    def size(self, ref: str) -> int:
+        return os.path.getsize(self.path(ref))
+
+    def original_size(self, ref: str) -> Optional[int]:
+        """Size of the upload `ref` was made from, if this process has seen it."""
+        with self._lock:
+            return self._original_sizes.get(ref)
+
+    def _remember_original(self, ref: str, size: int) -> None:
+        with self._lock:
+            self._original_sizes[ref] = size
+            self._original_sizes.move_to_end(ref)
+            while len(self._original_sizes) > self.sizes_cache:
+                self._original_sizes.popitem(last=False)
+
+    def _alias_path(self, key: str) -> str:
+        return os.path.join(self.root, "processed", key)
+
+    def put_processed(self, data: bytes, mime: str, detail: str = IMAGE_DETAIL) -> str:
+        """Downscale, strip EXIF and re-encode an upload, then store it.
+
+        Results are cached by the upload's hash and the settings used, as a
+        tiny alias file holding the ref and the upload's size, so
+        re-uploading the same photo (from any session) skips the
+        decode/encode work entirely.
+        """
+        settings = f"{MAX_LONG_SIDE}-{MAX_SHORT_SIDE}-{JPEG_QUALITY}-{detail}"
+        key = hashlib.sha256(data).hexdigest() + "-" + hashlib.sha256(settings.encode()).hexdigest()[:12]
+        alias = self._alias_path(key)
+        if os.path.exists(alias):
+            with open(alias) as f:
+                ref = f.readline().strip()
+            try:
+                if os.path.exists(self.path(ref)):
+                    self._remember_original(ref, len(data))
+                    return ref
+            except ValueError:
+                pass  # Unreadable alias; process the upload again and rewrite it
+
+        processed, out_mime = preprocess_image(data, mime, detail)
+        ref = self.put(processed, out_mime)
+        self._remember_original(ref, len(data))
+        write_atomic(alias, f"{ref}\n{len(data)}\n".encode())
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        with open(self.path(ref), "rb") as f:
+            return f.read()
+
+    def data_url(self, ref: str) -> str:
+        """Materialize a reference as a base64 data URL accepted by OpenAI Vision."""
+        with self._lock:
+            if ref in self._data_urls:
+                self._data_urls.move_to_end(ref)
+                return self._data_urls[ref]
+
+        mime = mimetypes.guess_type(ref)[0] or "image/png"
+        url = f"data:{mime};base64,{base64.b64encode(self.get(ref)).decode()}"
+
+        with self._lock:
+            if ref not in self._data_urls:
+                self._data_urls[ref] = url
+                self._data_url_bytes += len(url)
+            # Always keep the newest, even if it alone is over budget
+            while self._data_url_bytes > self.cache_bytes and len(self._data_urls) > 1:
+                _, evicted = self._data_urls.popitem(last=False)
+                self._data_url_bytes -= len(evicted)
+        return url
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write to a temp file and rename, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# -----------------------------------------------------------------------------
+# Preprocessing
+# -----------------------------------------------------------------------------
+
+def target_size(width: int, height: int, detail: str = IMAGE_DETAIL) -> Tuple[int, int]:
+    """Largest size the model will actually look at for this detail level."""
+    if detail == "low":
+        scale = LOW_DETAIL_SIDE / max(width, height)
+    else:
+        scale = min(MAX_LONG_SIDE / max(width, height), MAX_SHORT_SIDE / min(width, height))
+    scale = min(1.0, scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def preprocess_image(data: bytes, mime: str, detail: str = IMAGE_DETAIL) -> Tuple[bytes, str]:
+    """Downscale and re-encode an image; returns (bytes, mime).
+
+    Orientation from EXIF is applied to the pixels and all metadata (GPS,
+    camera info) is dropped by re-encoding. Photos become JPEG at
+    JPEG_QUALITY; PNGs stay PNG so screenshots of text stay sharp. Without
+    Pillow, or for anything Pillow can't read, the upload is returned as is.
+    """
+    if Image is None:
+        return data, mime
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            size = target_size(*img.size, detail=detail)
+            if size != img.size:
+                img = img.resize(size, Image.Resampling.LANCZOS)
+
+            out = io.BytesIO()
+            if mime == "image/png" or img.mode in ("RGBA", "LA", "P"):
+                img.save(out, format="PNG", optimize=True)
+                return out.getvalue(), "image/png"
+            img.convert("RGB").save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data, mime
+
+
+store = ImageStore()
+
+
+def is_image_ref(url: str) -> bool:
+    return url.startswith(REF_PREFIX)
+
+
+def store_upload(file, detail: str = IMAGE_DETAIL) -> str:
+    """Preprocess and store an uploaded image file; return its reference URL."""
+    mime = mimetypes.guess_type(file.name)[0] or "image/png"
+    return store.put_processed(file.read(), mime, detail)
+
+
+def image_part(file, detail: str = IMAGE_DETAIL) -> Dict:
+    """Build the image_url message part for an uploaded file."""
+    return {"type": "image_url", "image_url": {"url": store_upload(file, detail), "detail": detail}}
+
+
+def image_refs(messages: List[Dict]) -> List[str]:
+    """All stored image references in a message history, in order."""
+    return [
+        part["image_url"]["url"]
+        for msg in messages if isinstance(msg.get("content"), list)
+        for part in msg["content"]
+        if part.get("type") == "image_url" and is_image_ref(part["image_url"]["url"])
+    ]
+
+
+def bytes_saved(messages: List[Dict]) -> Tuple[int, int]:
+    """(original upload bytes, bytes actually sent) for the images in a request."""
+    original = sent = 0
+    for ref in image_refs(messages):
+        size = store.size(ref)
+        original += store.original_size(ref) or size
+        sent += size
+    return original, sent
+
+
+def show_image_savings(messages: List[Dict]) -> None:
+    """Toast how much preprocessing shrank the images sent with each request."""
+    # Only the Streamlit apps call this; headless users of the store don't need it
+    import streamlit as st
+    original, sent = bytes_saved(messages)
+    if original:
+        st.toast(f"🖼️ images per request: {original / 1e6:.2f} MB → {sent / 1e6:.2f} MB")
+
+
+def materialize_messages(messages: List[Dict]) -> List[Dict]:
+    """Return messages with stored image references swapped for data URLs.
+
+    The input list and its messages are left untouched, so histories in
+    session state keep holding references only.
+    """
+    out = []
+    for msg in messages:
+        content = msg.get("content")
+        if not isinstance(content, list):
+            out.append(msg)
+            continue
+
+        parts = []
+        for part in content:
+            if part.get("type") == "image_url" and is_image_ref(part["image_url"]["url"]):
+                url = store.data_url(part["image_url"]["url"])
+                part = dict(part, image_url=dict(part["image_url"], url=url))
+            parts.append(part)
+        out.append(dict(msg, content=parts))
+    return out
@@ -0,0 +1,271 @@
+import threading
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+import arena_db
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+ELO_K = 32
+ELO_BASE = 1000.0
+
+# Refit Bradley-Terry after this many new votes (or on demand)
+REFIT_EVERY = 25
+BOOTSTRAP_ROUNDS = 200
+# Virtual tie added to every pair that has played, so an unbeaten config
+# still gets a finite strength
+BT_PRIOR = 0.5
+
+# A config is one (model, prompt version); "model" and "prompt" pool them.
+SCOPES = ("combo", "model", "prompt")
+
+SCORES = {'a': (1.0, 0.0), 'b': (0.0, 1.0), 'tie': (0.5, 0.5)}
+
+# -----------------------------------------------------------------------------
+# Storage
+# -----------------------------------------------------------------------------
+# elo_ratings and pair_counts are created by arena_db.init_db().
+
+def scope_keys(config: Tuple[int, str, str]) -> Dict[str, str]:
+    config_id, model_id, prompt_id = config
+    return {"combo": str(config_id), "model": model_id, "prompt": prompt_id}
+
+
+def elo_expected(rating_a: float, rating_b: float) -> float:
+    return 1.0 / (1.0 + 10 ** ((rating_b - rating_a) / 400))
+
+# -----------------------------------------------------------------------------
+# Bradley-Terry
+# -----------------------------------------------------------------------------
+
+def fit_bradley_terry(wins: np.ndarray, prior: float = BT_PRIOR,
+                      iters: int = 500, tol: float = 1e-9) -> np.ndarray:
+    """Fit Bradley-Terry strengths with Hunter's MM updates.
+
+    `wins` has shape (..., n, n) with wins[..., i, j] = games i won against
+    j (ties count half to each side); leading dimensions are fitted
+    independently, which is how bootstrap rounds are batched. Returns
+    ratings on the Elo scale, centred on ELO_BASE.
+    """
+    played = (wins + np.swapaxes(wins, -1, -2)) > 0
+    wins = wins + prior / 2 * played
+    games = wins + np.swapaxes(wins, -1, -2)
+    total_wins = wins.sum(axis=-1)
+
+    strength = np.ones(wins.shape[:-1])
+    for _ in range(iters):
+        pair_sums = strength[..., :, None] + strength[..., None, :]
+        denom = (games / pair_sums).sum(axis=-1)
+        updated = np.where(denom > 0, total_wins / np.where(denom > 0, denom, 1), 1.0)
+        updated /= np.exp(np.log(updated).mean(axis=-1, keepdims=True))
+        if np.max(np.abs(updated - strength)) < tol:
+            strength = updated
+            break
+        strength = updated
+    return ELO_BASE + 400 * np.log10(strength)
+
+
+def bootstrap_bradley_terry(pairs: np.ndarray, counts: np.ndarray, n: int,
+                            rounds: int = BOOTSTRAP_ROUNDS, seed: int = 0) -> np.ndarray:
+    """Ratings for `rounds` resampled datasets, shape (rounds, n).
+
+    Each pair's (wins_i, wins_j, ties) is redrawn from a multinomial with the
+    observed proportions, all rounds and pairs in one vectorized call.
+    """
+    rng = np.random.default_rng(seed)
+    totals = counts.sum(axis=1).astype(np.int64)
+    draws = rng.multinomial(totals, counts / totals[:, None], size=(rounds, len(pairs)))
+    wins = np.zeros((rounds, n, n))
+    i, j = pairs[:, 0], pairs[:, 1]
+    np.add.at(wins, (slice(None), i, j), draws[..., 0] + draws[..., 2] / 2)
+    np.add.at(wins, (slice(None), j, i), draws[..., 1] + draws[..., 2] / 2)
+    return fit_bradley_terry(wins)
+
+# -----------------------------------------------------------------------------
+# Leaderboard
+# -----------------------------------------------------------------------------
+
+class Leaderboard:
+    """Online Elo plus periodically refitted Bradley-Terry over the votes table.
+
+    update() reads only votes above a high-water-mark id kept in the meta
+    table, applies them to the stored Elo ratings and pair counts, and moves
+    the mark, all in one transaction. Cost is O(new votes); Bradley-Terry
+    refits work from the pair counts, not from the votes.
+    """
+
+    def __init__(self, refit_every: int = REFIT_EVERY):
+        self.refit_every = refit_every
+        self._lock = threading.Lock()
+        self._fits: Dict[str, List[Dict]] = {}
+        # Vote count each scope was last fitted at
+        self._fit_votes: Dict[str, int] = {}
+
+    def _high_water(self, conn) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'leaderboard_hwm'").fetchone()
+        return row[0] if row else 0
+
+    def update(self) -> int:
+        """Fold votes recorded since the last call into the ratings.
+
+        Checks for new votes with a plain read first, so the common case
+        (nothing new) never takes the write lock.
+        """
+        conn = arena_db.connection()
+        migrating = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'votes_legacy'"
+        ).fetchone()
+        if migrating:
+            # Legacy votes get their old (lower) ids; wait until they are in
+            return 0
+        latest = conn.execute('SELECT MAX(id) FROM votes').fetchone()[0]
+        if latest is None or latest <= self._high_water(conn):
+            return 0
+
+        with self._lock, arena_db.transaction(immediate=True) as conn:
+            # Another session or process may have folded them in meanwhile
+            high_water = self._high_water(conn)
+            votes = conn.execute('''
+                SELECT v.id, v.winner, a.id, a.model_id, a.prompt_id, b.id, b.model_id, b.prompt_id
+                FROM votes v
+                JOIN configs a ON a.id = v.config_a
+                JOIN configs b ON b.id = v.config_b
+                WHERE v.id > ?
+                ORDER BY v.id
+            ''', (high_water,)).fetchall()
+            if not votes:
+                return 0
+
+            ratings = {
+                (scope, key): [rating, games]
+                for scope, key, rating, games in conn.execute('SELECT scope, key, rating, games FROM elo_ratings')
+            }
+            touched = set()
+            pairs: Dict[Tuple[int, int], List[int]] = {}
+
+            for vote_id, winner, *configs in votes:
+                keys_a, keys_b = scope_keys(configs[:3]), scope_keys(configs[3:])
+                score_a, score_b = SCORES[winner]
+                for scope in SCOPES:
+                    key_a, key_b = keys_a[scope], keys_b[scope]
+                    if key_a == key_b:
+                        continue
+                    a = ratings.setdefault((scope, key_a), [ELO_BASE, 0])
+                    b = ratings.setdefault((scope, key_b), [ELO_BASE, 0])
+                    expected_a = elo_expected(a[0], b[0])
+                    a[0] += ELO_K * (score_a - expected_a)
+                    b[0] += ELO_K * (score_b - (1 - expected_a))
+                    a[1] += 1
+                    b[1] += 1
+                    touched.update(((scope, key_a), (scope, key_b)))
+
+                config_a, config_b = configs[0], configs[3]
+                if config_a != config_b:
+                    lo, hi = sorted((config_a, config_b))
+                    counts = pairs.setdefault((lo, hi), [0, 0, 0])
+                    if winner == 'tie':
+                        counts[2] += 1
+                    elif (winner == 'a') == (config_a == lo):
+                        counts[0] += 1
+                    else:
+                        counts[1] += 1
+
+            conn.executemany('''
+                INSERT INTO elo_ratings (scope, key, rating, games) VALUES (?, ?, ?, ?)
+                ON CONFLICT(scope, key) DO UPDATE SET rating = excluded.rating, games = excluded.games
+            ''', [(scope, key, *ratings[scope, key]) for scope, key in touched])
+            conn.executemany('''
+                INSERT INTO pair_counts (config_lo, config_hi, wins_lo, wins_hi, ties) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(config_lo, config_hi) DO UPDATE SET
+                    wins_lo = wins_lo + excluded.wins_lo,
+                    wins_hi = wins_hi + excluded.wins_hi,
+                    ties = ties + excluded.ties
+            ''', [(lo, hi, *counts) for (lo, hi), counts in pairs.items()])
+            conn.execute('''
+                INSERT INTO meta (key, value) VALUES ('leaderboard_hwm', ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', (votes[-1][0],))
+            return len(votes)
+
+    def _labels(self, conn) -> Dict[int, Tuple[str, str, str]]:
+        """config id -> (combo label, model id, prompt id)."""
+        rows = conn.execute('''
+            SELECT c.id, c.model_id, c.model_name, c.prompt_id, pv.name, c.prompt_version
+            FROM configs c
+            JOIN prompt_versions pv ON pv.prompt_id = c.prompt_id AND pv.version = c.prompt_version
+        ''')
+        return {
+            config_id: (f"{model_name} · {prompt_name} @{version[:8]}", model_id, prompt_id)
+            for config_id, model_id, model_name, prompt_id, prompt_name, version in rows
+        }
+
+    def elo(self, scope: str) -> List[Dict]:
+        """Current online Elo ratings for a scope, best first."""
+        conn = arena_db.connection()
+        labels = self._labels(conn)
+        rows = conn.execute(
+            'SELECT key, rating, games FROM elo_ratings WHERE scope = ? ORDER BY rating DESC', (scope,)
+        ).fetchall()
+        return [
+            {"name": labels[int(key)][0] if scope == "combo" else key, "elo": round(rating), "games": games}
+            for key, rating, games in rows
+        ]
+
+    def bradley_terry(self, scope: str, force: bool = False) -> List[Dict]:
+        """Bradley-Terry ratings with 95% bootstrap intervals for a scope.
+
+        Cached until REFIT_EVERY more votes have come in, unless forced.
+        """
+        total = arena_db.connection().execute('SELECT COUNT(*) FROM votes').fetchone()[0]
+        with self._lock:
+            if not force and scope in self._fits and total - self._fit_votes.get(scope, 0) < self.refit_every:
+                return self._fits[scope]
+
+        fit = self._fit(scope)
+        with self._lock:
+            self._fits[scope] = fit
+            self._fit_votes[scope] = total
+        return fit
+
+    def _fit(self, scope: str) -> List[Dict]:
+        conn = arena_db.connection()
+        labels = self._labels(conn)
+        field = {"combo": 0, "model": 1, "prompt": 2}[scope]
+
+        # Pool config pairs into scope-level pairs
+        pooled: Dict[Tuple[str, str], np.ndarray] = {}
+        for lo, hi, wins_lo, wins_hi, ties in conn.execute('SELECT * FROM pair_counts'):
+            key_lo, key_hi = labels[lo][field], labels[hi][field]
+            if key_lo == key_hi:
+                continue
+            if key_lo > key_hi:
+                key_lo, key_hi, wins_lo, wins_hi = key_hi, key_lo, wins_hi, wins_lo
+            counts = pooled.setdefault((key_lo, key_hi), np.zeros(3, dtype=np.int64))
+            counts += (wins_lo, wins_hi, ties)
+        if not pooled:
+            return []
+
+        names = sorted({key for pair in pooled for key in pair})
+        index = {name: i for i, name in enumerate(names)}
+        pairs = np.array([(index[a], index[b]) for a, b in pooled])
+        counts = np.array(list(pooled.values()))
+
+        wins = np.zeros((len(names), len(names)))
+        np.add.at(wins, (pairs[:, 0], pairs[:, 1]), counts[:, 0] + counts[:, 2] / 2)
+        np.add.at(wins, (pairs[:, 1], pairs[:, 0]), counts[:, 1] + counts[:, 2] / 2)
+        ratings = fit_bradley_terry(wins)
+        samples = bootstrap_bradley_terry(pairs, counts, len(names))
+        low, high = np.percentile(samples, [2.5, 97.5], axis=0)
+        games = (wins + wins.T).sum(axis=1)
+
+        results = [
+            {"name": name, "rating": round(float(ratings[i])), "ci_low": round(float(low[i])),
+             "ci_high": round(float(high[i])), "games": int(games[i])}
+            for i, name in enumerate(names)
+        ]
+        return sorted(results, key=lambda r: -r["rating"])
+
+
+leaderboard = Leaderboard()
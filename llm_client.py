@@ -0,0 +1,383 @@
+import os
+import re
+import time
+import random
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Iterator, Optional
+
+import httpx
+import openai
+
+from history import count_messages
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+# One client (and one connection pool) is shared by every Streamlit session
+# in the process. A head-to-head session streams two replies at once, so
+# MAX_CONNECTIONS should be about twice the number of concurrent sessions
+# expected; requests beyond it wait up to POOL_TIMEOUT for a free connection.
+MAX_CONNECTIONS = int(os.getenv("NISA_OPENAI_MAX_CONNECTIONS", "100"))
+# Idle connections kept open so the next request skips TCP + TLS setup
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30.0
+
+CONNECT_TIMEOUT = 5.0
+# Longest gap between two streamed chunks, not the whole reply
+READ_TIMEOUT = 60.0
+WRITE_TIMEOUT = 10.0
+POOL_TIMEOUT = 10.0
+
+# HTTP/2 multiplexes concurrent streams over one connection; needs `h2`
+HTTP2 = os.getenv("NISA_OPENAI_HTTP2", "0") == "1"
+
+# Retries happen here, not in the SDK, so they can respect the shared
+# per-model budgets and stop once a reply has started streaming.
+RETRY_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+# Longest a request waits for budget before giving up
+MAX_QUEUE_WAIT = 60.0
+
+# Send the prompt version as prompt_cache_key so requests sharing a system
+# prompt are routed to the same cache; off for endpoints that reject it
+PROMPT_CACHE_KEY = os.getenv("NISA_PROMPT_CACHE_KEY", "1") == "1"
+# OpenAI only caches prompts of at least this many tokens
+MIN_CACHED_PROMPT_TOKENS = 1024
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Client factory
+# -----------------------------------------------------------------------------
+
+def make_http_client(http2: bool = HTTP2, max_connections: int = MAX_CONNECTIONS) -> httpx.Client:
+    """Build the pooled httpx client used under the OpenAI SDK."""
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:  # fall back to HTTP/1.1 rather than fail at startup
+            http2 = False
+
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(MAX_KEEPALIVE_CONNECTIONS, max_connections),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=CONNECT_TIMEOUT,
+            read=READ_TIMEOUT,
+            write=WRITE_TIMEOUT,
+            pool=POOL_TIMEOUT,
+        ),
+    )
+
+
+def make_client(base_url: Optional[str] = None, api_key: Optional[str] = None, **http_options) -> openai.OpenAI:
+    """Build an OpenAI client on its own pooled httpx client.
+
+    base_url defaults to OPENAI_BASE_URL (the SDK's own default otherwise),
+    which is how the apps are pointed at benchmarks/mock_openai.py.
+    """
+    return openai.OpenAI(
+        api_key=api_key or os.getenv("OPENAI_API_KEY"),
+        base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+        http_client=make_http_client(**http_options),
+        max_retries=0,
+    )
+
+
+_client: Optional[openai.OpenAI] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> openai.OpenAI:
+    """Return the process-wide OpenAI client shared by every session."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = make_client()
+    return _client
+
+# -----------------------------------------------------------------------------
+# Rate limits and retries
+# -----------------------------------------------------------------------------
+
+class CompletionError(Exception):
+    """A model call that failed for good; the message is safe to show users."""
+
+    def __init__(self, message: str, partial: bool = False):
+        super().__init__(message)
+        # True when some of the reply had already been streamed
+        self.partial = partial
+
+
+RESET_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+RESET_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds from an x-ratelimit-reset-* header such as "6m0s" or "20ms"."""
+    if not value:
+        return None
+    parts = RESET_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * RESET_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int, prompt_tokens: Optional[int] = None) -> int:
+    """Token cost of a request as rate limits count it: prompt plus max_tokens.
+
+    Pass prompt_tokens when the caller already knows them (a HistoryWindow
+    does) to skip re-tokenizing the whole request.
+    """
+    if prompt_tokens is None:
+        prompt_tokens = count_messages(messages)
+    return prompt_tokens + max_tokens
+
+
+class ModelBudget:
+    """What OpenAI last told us about one model's request and token limits."""
+
+    def __init__(self):
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def update(self, headers, now: float) -> None:
+        requests = headers.get("x-ratelimit-remaining-requests")
+        tokens = headers.get("x-ratelimit-remaining-tokens")
+        if requests is not None:
+            self.remaining_requests = int(requests)
+            self.requests_reset_at = now + (parse_reset(headers.get("x-ratelimit-reset-requests")) or 0)
+        if tokens is not None:
+            self.remaining_tokens = int(tokens)
+            self.tokens_reset_at = now + (parse_reset(headers.get("x-ratelimit-reset-tokens")) or 0)
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a request of `tokens` should fit, 0 if it fits now."""
+        wait = max(0.0, self.blocked_until - now)
+        if self.remaining_requests is not None and self.remaining_requests < 1:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+        return max(0.0, wait)
+
+    def reserve(self, tokens: int, now: float) -> None:
+        # Spend the budget locally until the next response headers correct it
+        if now >= self.requests_reset_at:
+            self.remaining_requests = None
+        if now >= self.tokens_reset_at:
+            self.remaining_tokens = None
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= tokens
+
+
+class RequestScheduler:
+    """Process-wide gate in front of every model call.
+
+    Keeps a ModelBudget per model from the x-ratelimit-* headers of recent
+    responses, so all sessions in the process share one view of the
+    remaining requests and tokens. acquire() holds a request back until
+    the budget is expected to allow it; 429s block the model for their
+    retry-after.
+    """
+
+    def __init__(self):
+        self._budgets: Dict[str, ModelBudget] = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, model: str) -> ModelBudget:
+        if model not in self._budgets:
+            self._budgets[model] = ModelBudget()
+        return self._budgets[model]
+
+    def acquire(self, model: str, tokens: int, max_wait: float = MAX_QUEUE_WAIT) -> None:
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                budget = self._budget(model)
+                wait = budget.wait_time(tokens, now)
+                if wait == 0:
+                    budget.reserve(tokens, now)
+                    return
+            if now + wait > deadline:
+                raise CompletionError(f"{model} is over its rate limit, try again in {wait:.0f}s")
+            # Jitter so queued requests don't all fire at the reset instant
+            time.sleep(wait + random.uniform(0, min(1.0, wait)))
+
+    def record(self, model: str, headers) -> None:
+        with self._lock:
+            self._budget(model).update(headers, time.monotonic())
+
+    def block(self, model: str, seconds: float) -> None:
+        with self._lock:
+            budget = self._budget(model)
+            budget.blocked_until = max(budget.blocked_until, time.monotonic() + seconds)
+
+
+scheduler = RequestScheduler()
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server asked."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+def _retry_after(error: openai.APIStatusError) -> Optional[float]:
+    headers = error.response.headers
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return parse_reset(headers.get("x-ratelimit-reset-requests"))
+
+
+def _describe(error: Exception, model: str) -> str:
+    if isinstance(error, openai.RateLimitError):
+        return f"{model} is rate limited right now"
+    if isinstance(error, openai.APITimeoutError):
+        return f"{model} timed out"
+    if isinstance(error, openai.APIConnectionError):
+        return f"Couldn't reach the API for {model}"
+    if isinstance(error, openai.APIStatusError):
+        return f"{model} returned an error ({error.status_code})"
+    return f"{model} failed: {error}"
+
+
+# -----------------------------------------------------------------------------
+# Request layout and prompt caching
+# -----------------------------------------------------------------------------
+# OpenAI caches the longest previously seen prefix of a request, in exact
+# bytes. The system prompt comes first and is byte-for-byte the stored
+# prompt; every message is rebuilt with the same keys in the same order,
+# and within a message text goes before images, so nothing per-session
+# lands ahead of the shared part.
+
+def canonical_message(msg: Dict) -> Dict:
+    content = msg.get("content")
+    if isinstance(content, list):
+        texts = [{"type": "text", "text": part["text"]} for part in content if part.get("type") == "text"]
+        images = [
+            {"type": "image_url", "image_url": {"url": part["image_url"]["url"], "detail": part["image_url"].get("detail", "auto")}}
+            for part in content if part.get("type") == "image_url"
+        ]
+        content = texts + images
+    return {"role": msg["role"], "content": content}
+
+
+def canonical_messages(messages: List[Dict]) -> List[Dict]:
+    return [canonical_message(msg) for msg in messages]
+
+
+def prompt_version(messages: List[Dict]) -> Optional[str]:
+    """The system prompt's content hash (as in prompt_versions), if there is one."""
+    if messages and messages[0]["role"] == "system" and isinstance(messages[0]["content"], str):
+        return hashlib.sha256(messages[0]["content"].encode()).hexdigest()
+    return None
+
+
+class PromptCacheStats:
+    """Prompt-cache hits per (prompt version, model), from streamed usage."""
+
+    def __init__(self):
+        self._stats: Dict[tuple, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, version: Optional[str], model: str, usage) -> None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        with self._lock:
+            stats = self._stats.setdefault((version, model), [0, 0, 0])
+            stats[0] += 1
+            stats[1] += usage.prompt_tokens
+            stats[2] += cached
+            requests, prompt_tokens, cached_tokens = stats
+        logger.info(
+            "prompt cache %s/%s: %d of %d prompt tokens cached (%.0f%% over %d requests)",
+            (version or "-")[:8], model, cached, usage.prompt_tokens,
+            100 * cached_tokens / max(prompt_tokens, 1), requests,
+        )
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            items = [(key, list(stats)) for key, stats in self._stats.items()]
+        return [
+            {
+                "prompt_version": version,
+                "model": model,
+                "requests": requests,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+                # Shorter prompts are never cached, however stable they are
+                "cacheable": prompt_tokens >= MIN_CACHED_PROMPT_TOKENS * requests,
+            }
+            for (version, model), (requests, prompt_tokens, cached_tokens) in sorted(items, key=lambda i: -i[1][1])
+        ]
+
+
+cache_stats = PromptCacheStats()
+
+
+def stream_completion(model: str, messages: List[Dict], max_tokens: int = 1000,
+                      prompt_tokens: Optional[int] = None, **params) -> Iterator[str]:
+    """Stream a chat completion's text through the shared scheduler.
+
+    Rate limits, 5xx and connection errors are retried with backoff, but
+    only until the first token: after that a retry would repeat text the
+    user has already seen. Failures raise CompletionError instead of
+    being yielded, so callers never mistake an error for reply text.
+    Messages are sent in canonical layout, and the usage chunk at the end
+    of the stream feeds cache_stats. prompt_tokens, if known, is the
+    messages' token count for the scheduler's budget.
+    """
+    messages = canonical_messages(messages)
+    version = prompt_version(messages)
+    if PROMPT_CACHE_KEY and version is not None:
+        params["extra_body"] = {"prompt_cache_key": version[:32], **params.get("extra_body", {})}
+    tokens = estimate_tokens(messages, max_tokens, prompt_tokens)
+    for attempt in range(RETRY_ATTEMPTS):
+        scheduler.acquire(model, tokens)
+        started = False
+        try:
+            raw = get_client().chat.completions.with_raw_response.create(
+                model=model, messages=messages, max_tokens=max_tokens, stream=True,
+                stream_options={"include_usage": True}, **params
+            )
+            scheduler.record(model, raw.headers)
+            for chunk in raw.parse():
+                if chunk.usage is not None:
+                    # The last chunk: usage only, no choices
+                    cache_stats.record(version, model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    started = True
+                    yield chunk.choices[0].delta.content
+            return
+        except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+            retry_after = None
+            if isinstance(e, openai.APIStatusError):
+                scheduler.record(model, e.response.headers)
+                retry_after = _retry_after(e)
+                if isinstance(e, openai.RateLimitError) and retry_after:
+                    scheduler.block(model, retry_after)
+            if started or attempt == RETRY_ATTEMPTS - 1:
+                raise CompletionError(_describe(e, model), partial=started) from e
+            time.sleep(backoff_delay(attempt, retry_after))
+        except openai.OpenAIError as e:
+            raise CompletionError(_describe(e, model), partial=started) from e
@@ -0,0 +1,108 @@
+import random
+from itertools import combinations
+from typing import List, Dict, Tuple
+
+import arena_db
+from arena_db import prompt_hash
+from leaderboard import leaderboard, elo_expected, ELO_BASE
+
+# -----------------------------------------------------------------------------
+# Pairing scheduler
+# -----------------------------------------------------------------------------
+# Every head-to-head vote costs a coach's time, so pairs are chosen where a
+# vote teaches us the most: close matchups (p near 0.5) between configs we
+# have few votes on. Pairs are drawn at random in proportion to that score
+# rather than taking the single best, so concurrent sessions spread out and
+# every pair keeps some chance of being shown.
+
+# Share of pairings drawn uniformly, so a stale rating can always be corrected
+EXPLORE = 0.1
+
+ConfigKey = Tuple[str, str, str]  # (model id, prompt id, prompt version)
+
+
+def config_key(config: Dict) -> ConfigKey:
+    prompt = config["prompt"]
+    return (config["model"]["id"], prompt["id"], prompt.get("version") or prompt_hash(prompt["prompt"]))
+
+
+def pair_score(rating_a: float, rating_b: float, games_a: int, games_b: int, pair_games: int) -> float:
+    """Expected information from one more vote between a and b.
+
+    p(1-p) is the Fisher information of a comparison; it is scaled by how
+    uncertain the two ratings still are (roughly 1/games each) and damped by
+    how often this exact pair has already been shown.
+    """
+    p = elo_expected(rating_a, rating_b)
+    uncertainty = 1 / (games_a + 1) + 1 / (games_b + 1)
+    return p * (1 - p) * uncertainty / (1 + pair_games) ** 0.5
+
+
+def pick_pair(keys: List, ratings: Dict, games: Dict, pair_games: Dict,
+              rng: random.Random = random) -> Tuple:
+    """Choose two distinct keys; the returned order is random (left/right).
+
+    `ratings` and `games` map key -> Elo rating / votes played, `pair_games`
+    maps frozenset({a, b}) -> votes between the two. Missing keys count as
+    new configs.
+    """
+    keys = list(dict.fromkeys(keys))
+    if len(keys) < 2:
+        raise ValueError("Need at least two distinct configs to pair")
+
+    pairs = list(combinations(keys, 2))
+    if rng.random() < EXPLORE:
+        pair = rng.choice(pairs)
+    else:
+        weights = [
+            pair_score(
+                ratings.get(a, ELO_BASE), ratings.get(b, ELO_BASE),
+                games.get(a, 0), games.get(b, 0), pair_games.get(frozenset((a, b)), 0),
+            )
+            for a, b in pairs
+        ]
+        pair = rng.choices(pairs, weights=weights)[0]
+
+    # Blind: which side a config lands on carries no information
+    return pair if rng.random() < 0.5 else pair[::-1]
+
+
+def load_pairing_stats(keys: List[ConfigKey]) -> Tuple[Dict, Dict, Dict]:
+    """Current Elo ratings, vote counts and per-pair counts for `keys`."""
+    leaderboard.update()
+    conn = arena_db.connection()
+
+    ids = {
+        (model_id, prompt_id, version): config_id
+        for config_id, model_id, prompt_id, version in conn.execute(
+            'SELECT id, model_id, prompt_id, prompt_version FROM configs'
+        )
+    }
+    by_id = {ids[key]: key for key in keys if key in ids}
+
+    ratings, games = {}, {}
+    for key, rating, played in conn.execute(
+        "SELECT key, rating, games FROM elo_ratings WHERE scope = 'combo'"
+    ):
+        if int(key) in by_id:
+            ratings[by_id[int(key)]] = rating
+            games[by_id[int(key)]] = played
+
+    pair_games = {}
+    for lo, hi, wins_lo, wins_hi, ties in conn.execute('SELECT * FROM pair_counts'):
+        if lo in by_id and hi in by_id:
+            pair_games[frozenset((by_id[lo], by_id[hi]))] = wins_lo + wins_hi + ties
+    return ratings, games, pair_games
+
+
+def choose_pair(models: List[Dict], prompts: List[Dict]) -> Tuple[Dict, Dict]:
+    """Pick (left_config, right_config) for a new head-to-head session."""
+    configs = {}
+    for model in models:
+        for prompt in prompts:
+            config = {"model": model, "prompt": prompt}
+            configs.setdefault(config_key(config), config)
+
+    keys = list(configs)
+    left, right = pick_pair(keys, *load_pairing_stats(keys))
+    return configs[left], configs[right]
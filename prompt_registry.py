@@ -0,0 +1,109 @@
+import time
+import threading
+from typing import List, Dict, Optional, Tuple
+
+import arena_db
+
+# How long a cached prompt set is trusted before we do a single cheap version
+# check against the DB. Saves made through this process invalidate at once;
+# this only matters for writes from another process sharing nisa_arena.db.
+REVALIDATE_SECONDS = 30.0
+
+
+class PromptRegistry:
+    """Process-wide cache of the prompts table.
+
+    One instance is shared by every Streamlit session. The cached set is only
+    reloaded when the prompts version in the meta table changes, which happens
+    exactly when save_system_prompts commits. Between revalidations, reads do
+    not touch the database at all.
+    """
+
+    def __init__(self, revalidate_seconds: float = REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        self._lock = threading.Lock()
+        self._prompts: Optional[List[Dict]] = None
+        self._active: List[Dict] = []
+        self._version_counts: Dict[str, int] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def _load(self) -> None:
+        # Read the version first: if a save slips in between, we hold newer
+        # data under an older version and simply reload once more later.
+        version = arena_db.get_prompts_version()
+        prompts = arena_db.load_system_prompts()
+        self._prompts = prompts
+        self._active = [
+            {'id': p['id'], 'name': p['name'], 'prompt': p['prompt'], 'version': p['version']}
+            for p in prompts if p['active']
+        ]
+        # Saving a new version bumps the prompts version, so this stays in step
+        self._version_counts = arena_db.count_prompt_versions()
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self) -> Tuple[List[Dict], List[Dict], Dict[str, int]]:
+        """Return (all prompts, active prompts, version counts), reloading first if stale.
+
+        The lists are taken under the lock, so a concurrent invalidate()
+        can't clear them between the check and the caller's copy.
+        """
+        with self._lock:
+            if self._prompts is None:
+                self._load()
+            elif time.monotonic() - self._checked_at >= self.revalidate_seconds:
+                if arena_db.get_prompts_version() != self._version:
+                    self._load()
+                else:
+                    self._checked_at = time.monotonic()
+            return self._prompts, self._active, self._version_counts
+
+    def all(self) -> List[Dict]:
+        """All prompts with their active flag, as fresh dicts safe to mutate."""
+        prompts, _, _ = self._ensure_fresh()
+        return [dict(p) for p in prompts]
+
+    def active(self) -> List[Dict]:
+        """Only active prompts, as fresh dicts safe to mutate."""
+        _, active, _ = self._ensure_fresh()
+        return [dict(p) for p in active]
+
+    def version_counts(self) -> Dict[str, int]:
+        """Recorded versions per prompt id."""
+        _, _, counts = self._ensure_fresh()
+        return dict(counts)
+
+    def save(self, prompts: List[Dict]) -> None:
+        """Persist prompts and drop the cached set if anything changed."""
+        version = arena_db.save_system_prompts(prompts)
+        if version != self._version:
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._prompts = None
+            self._version = None
+
+
+registry = PromptRegistry()
+
+
+def load_system_prompts() -> List[Dict]:
+    """Cached equivalent of arena_db.load_system_prompts."""
+    return registry.all()
+
+
+def load_active_prompts() -> List[Dict]:
+    """Cached equivalent of arena_db.load_active_prompts."""
+    return registry.active()
+
+
+def load_prompt_version_counts() -> Dict[str, int]:
+    """Cached count of recorded versions per prompt id."""
+    return registry.version_counts()
+
+
+def save_system_prompts(prompts: List[Dict]) -> None:
+    """Save prompts and invalidate the shared cache."""
+    registry.save(prompts)
@@ -186,6 +186,27 @@ A simple example of this is:
 "Looks like Mr. Smith needs to focus on motivating students to stay on task and launching the lesson efficiently. I'll suggest a few PD goals to help him with that."
 """
 
-nisa_a = og_nisa + og_examples + core_actions_expertise
-nisa_b = og_nisa + og_examples + teacher_move_expertise_basic
-nisa_c = og_nisa + teacher_move_expertise_basic
\ No newline at end of file
+# Named fragments, seeded into the fragment library in nisa_arena.db so
+# prompts pasted into the settings panel are stored as references to them
+FRAGMENTS = {
+    "og_nisa": og_nisa,
+    "og_examples": og_examples,
+    "core_actions_expertise": core_actions_expertise,
+    "teacher_move_expertise_basic": teacher_move_expertise_basic,
+}
+
+# Each prompt is a recipe: fragment names, concatenated in order
+RECIPES = {
+    "nisa_a": ["og_nisa", "og_examples", "core_actions_expertise"],
+    "nisa_b": ["og_nisa", "og_examples", "teacher_move_expertise_basic"],
+    "nisa_c": ["og_nisa", "teacher_move_expertise_basic"],
+}
+
+
+def assemble(recipe) -> str:
+    return "".join(FRAGMENTS[name] for name in recipe)
+
+
+nisa_a = assemble(RECIPES["nisa_a"])
+nisa_b = assemble(RECIPES["nisa_b"])
+nisa_c = assemble(RECIPES["nisa_c"])
\ No newline at end of file
@@ -0,0 +1,263 @@
+import time
+import queue
+import threading
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# -----------------------------------------------------------------------------
+# Concurrent token streams
+# -----------------------------------------------------------------------------
+
+@dataclass
+class StreamStats:
+    """Timing for one streamed reply, in seconds since the streams started."""
+    started_at: float
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: int = 0
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def total_latency(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def as_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "ttft": self.time_to_first_token,
+            "total": self.total_latency,
+            "chunks": self.chunks,
+        }
+
+
+# Queued by cancel() to wake the consumer
+_CANCELLED = object()
+
+
+class ConcurrentStreams:
+    """Multiplex any number of token generators onto one blocking event queue.
+
+    Each stream is drained on its own worker (a fresh daemon thread, or the
+    given executor), which tags every chunk with the stream's name and puts
+    it on a single shared queue. Iterating blocks on that queue and yields
+    (name, chunk) the moment any stream produces a chunk, and (name, None)
+    once that stream is finished, so a slow first token on one side never
+    holds up rendering of the other and the consumer never busy-polls.
+    All Streamlit calls stay on the consuming (script) thread.
+
+    A single stream can be stopped with cancel(name), or by `timeout`
+    seconds passing since the streams started; it then ends early with
+    (name, None) while the others carry on, and `status[name]` says why.
+    With cancel_on_exit=False the workers keep going when the consumer is
+    interrupted (a Streamlit rerun), and iterating again resumes where the
+    last loop stopped, so the object can live in session state.
+    With raise_errors=False a stream that raises ends like any other, with
+    status "error" and the exception kept in `errors[name]`, instead of
+    aborting the whole iteration.
+    """
+
+    def __init__(self, streams: Dict[str, Iterable[str]], executor: Optional[Executor] = None,
+                 timeout: Optional[float] = None, cancel_on_exit: bool = True, raise_errors: bool = True):
+        self.streams = streams
+        self.executor = executor
+        self.timeout = timeout
+        self.cancel_on_exit = cancel_on_exit
+        self.raise_errors = raise_errors
+        self.stats: Dict[str, StreamStats] = {}
+        self.status: Dict[str, str] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self._events: "queue.Queue[Tuple[str, object]]" = queue.Queue()
+        self._cancel = threading.Event()
+        self._stopped = {name: threading.Event() for name in streams}
+        self._pending: Optional[set] = None
+        self._deadline: Optional[float] = None
+
+    def _drive(self, name: str, stream: Iterable[str]) -> None:
+        try:
+            for chunk in stream:
+                if self._cancel.is_set() or self._stopped[name].is_set():
+                    break
+                self._events.put((name, chunk))
+        except BaseException as e:
+            self._events.put((name, e))
+        finally:
+            # Release the HTTP response now rather than when garbage collected
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            self._events.put((name, None))
+
+    def _start(self) -> None:
+        start = time.perf_counter()
+        self.stats = {name: StreamStats(started_at=start) for name in self.streams}
+        self.status = {name: "running" for name in self.streams}
+        self._pending = set(self.streams)
+        if self.timeout is not None:
+            self._deadline = start + self.timeout
+        for name, stream in self.streams.items():
+            if self.executor is not None:
+                self.executor.submit(self._drive, name, stream)
+            else:
+                threading.Thread(target=self._drive, args=(name, stream), daemon=True).start()
+
+    def cancel(self, name: str) -> None:
+        """Stop one stream; the consumer sees it end on its next step."""
+        self._stopped[name].set()
+        self._events.put((name, _CANCELLED))
+
+    @property
+    def done(self) -> bool:
+        return self._pending is not None and not self._pending
+
+    def _end(self, name: str, status: str) -> None:
+        self._stopped[name].set()
+        self.stats[name].finished_at = time.perf_counter()
+        self.status[name] = status
+        self._pending.discard(name)
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[str]]]:
+        if self._pending is None:
+            self._start()
+
+        try:
+            while self._pending:
+                wait = None if self._deadline is None else max(0.0, self._deadline - time.perf_counter())
+                try:
+                    name, item = self._events.get(timeout=wait)
+                except queue.Empty:
+                    for name in sorted(self._pending):
+                        self._end(name, "timeout")
+                        yield name, None
+                    continue
+
+                if name not in self._pending:
+                    # Leftovers from a stream that was cancelled or timed out
+                    continue
+                stats = self.stats[name]
+                if item is None:
+                    self._end(name, "done")
+                    yield name, None
+                elif item is _CANCELLED:
+                    self._end(name, "cancelled")
+                    yield name, None
+                elif isinstance(item, BaseException):
+                    self._end(name, "error")
+                    if self.raise_errors or not isinstance(item, Exception):
+                        raise item
+                    self.errors[name] = item
+                    yield name, None
+                else:
+                    if stats.first_token_at is None:
+                        stats.first_token_at = time.perf_counter()
+                    stats.chunks += 1
+                    yield name, item
+        finally:
+            # Consumer went away (error, st.stop, rerun): let workers wind down,
+            # unless the caller means to resume.
+            if self.cancel_on_exit or self.done:
+                self._cancel.set()
+
+# -----------------------------------------------------------------------------
+# Response accumulation
+# -----------------------------------------------------------------------------
+
+class ResponseBuffer:
+    """Accumulate a streamed reply in amortized O(1) per chunk.
+
+    Repeated `response += chunk` copies the whole reply on every token once
+    the string is held anywhere else (a dict, session state), which makes
+    long replies quadratic. Chunks are appended to a list instead and only
+    joined when someone asks for the text: str() compacts the pending chunks
+    into the cached prefix, so throttled renders pay for new chunks only
+    once, and getvalue() returns the final string.
+    """
+
+    __slots__ = ("_text", "_pending", "_length")
+
+    def __init__(self):
+        self._text = ""
+        self._pending: list = []
+        self._length = 0
+
+    def append(self, chunk: str) -> None:
+        self._pending.append(chunk)
+        self._length += len(chunk)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        if self._pending:
+            self._pending.insert(0, self._text)
+            self._text = "".join(self._pending)
+            self._pending = []
+        return self._text
+
+    getvalue = __str__
+
+    def strip(self) -> str:
+        """Trim surrounding whitespace once the reply is complete; returns the text."""
+        self._text = str(self).strip()
+        self._length = len(self._text)
+        return self._text
+
+
+# -----------------------------------------------------------------------------
+# Throttled rendering
+# -----------------------------------------------------------------------------
+
+RENDER_FPS = 10
+RENDER_MAX_PENDING_CHARS = 1024
+CURSOR = "▌"
+
+
+class RenderScheduler:
+    """Coalesce streamed tokens into a few placeholder renders.
+
+    Every placeholder.markdown() call re-sends the whole reply over the
+    Streamlit websocket, so rendering once per token costs O(n²) bytes.
+    update() only re-renders when 1/fps seconds have passed or more than
+    max_pending_chars have arrived since the last render; finish() always
+    does a final render without the cursor.
+    """
+
+    def __init__(self, placeholder, fps: float = RENDER_FPS,
+                 max_pending_chars: int = RENDER_MAX_PENDING_CHARS, cursor: str = CURSOR):
+        self.placeholder = placeholder
+        self.interval = 1.0 / fps if fps else 0.0
+        self.max_pending_chars = max_pending_chars
+        self.cursor = cursor
+        self.render_calls = 0
+        self.bytes_sent = 0
+        self._rendered_len = 0
+        self._last_render = 0.0
+
+    def _render(self, text: str) -> None:
+        self.placeholder.markdown(text)
+        self.render_calls += 1
+        self.bytes_sent += len(text.encode())
+        self._last_render = time.perf_counter()
+
+    def update(self, text) -> bool:
+        """Offer the reply so far; render it if a frame is due. Returns True if rendered."""
+        pending = len(text) - self._rendered_len
+        if pending <= 0:
+            return False
+        due = time.perf_counter() - self._last_render >= self.interval
+        if not due and pending < self.max_pending_chars:
+            return False
+        self._rendered_len = len(text)
+        self._render(str(text) + self.cursor)
+        return True
+
+    def finish(self, text) -> None:
+        """Render the complete reply without the cursor."""
+        self._rendered_len = len(text)
+        self._render(str(text))
@@ -0,0 +1,84 @@
+"""
+arena_db migrations of pre-normalized databases, on throwaway copies.
+
+Usage: python -m pytest tests
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arena_db
+
+PROMPT = {"id": "a", "name": "A", "prompt": "You are coach A."}
+LEFT = {"model": {"id": "gpt-4.1", "name": "GPT-4.1"}, "prompt": PROMPT}
+RIGHT = {"model": {"id": "gpt-4.1-mini", "name": "GPT-4.1 Mini"}, "prompt": PROMPT}
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database in the original layout: prompt text in prompts, votes as JSON blobs."""
+    path = str(tmp_path / "nisa_arena.db")
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE prompts (id TEXT PRIMARY KEY, name TEXT NOT NULL, prompt TEXT NOT NULL, active INTEGER DEFAULT 1)')
+    conn.execute('INSERT INTO prompts VALUES (?, ?, ?, 1)', (PROMPT["id"], PROMPT["name"], PROMPT["prompt"]))
+    conn.execute('''
+        CREATE TABLE votes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            conversation TEXT NOT NULL,
+            left_config TEXT NOT NULL,
+            right_config TEXT NOT NULL,
+            winner TEXT NOT NULL
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO votes (id, timestamp, conversation, left_config, right_config, winner) VALUES (?, ?, ?, ?, ?, ?)',
+        [(vote_id, "2025-01-01T00:00:00", json.dumps([{"user": f"q{vote_id}", "left": "l", "right": "r"}]),
+          json.dumps(LEFT), json.dumps(RIGHT), "left") for vote_id in (3, 5, 9)]
+    )
+    conn.commit()
+    conn.close()
+
+    db_path = arena_db.DB_PATH
+    arena_db.set_db_path(path)
+    yield path
+    arena_db.set_db_path(db_path)
+
+
+def wait_for_migration() -> None:
+    for thread in threading.enumerate():
+        if thread.name == "legacy-vote-migration":
+            thread.join(10)
+
+
+def test_legacy_votes_and_prompts_are_migrated(legacy_db):
+    arena_db.init_db()
+    wait_for_migration()
+    conn = arena_db.connection()
+
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'votes_legacy'").fetchone()
+    assert [row[0] for row in conn.execute('SELECT id FROM votes ORDER BY id')] == [3, 5, 9]
+    assert conn.execute('SELECT user FROM turns WHERE vote_id = 5').fetchone()[0] == "q5"
+    assert [(p["id"], p["prompt"]) for p in arena_db.load_active_prompts()] == [(PROMPT["id"], PROMPT["prompt"])]
+
+    # New votes continue after the legacy ids
+    with arena_db.transaction(immediate=True) as conn:
+        vote_id = arena_db.insert_vote(conn, [{"user": "new", "left": "l", "right": "r"}], LEFT, RIGHT,
+                                       "tie", "2026-01-01T00:00:00")
+    assert vote_id == 10
+
+
+def test_read_active_prompts_leaves_the_file_alone(legacy_db):
+    with open(legacy_db, "rb") as f:
+        before = f.read()
+    prompts = arena_db.read_active_prompts(legacy_db)
+    assert [(p["id"], p["prompt"]) for p in prompts] == [(PROMPT["id"], PROMPT["prompt"])]
+    with open(legacy_db, "rb") as f:
+        assert f.read() == before
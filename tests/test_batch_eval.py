@@ -0,0 +1,100 @@
+"""
+batch_eval.run_batch against benchmarks/mock_openai.py on a throwaway database.
+
+Usage: python -m pytest tests
+"""
+
+import os
+import sys
+import json
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arena_db
+import batch_eval
+import llm_client
+from benchmarks.mock_openai import start_server
+from llm_client import CompletionError
+
+MODELS = [{"id": "gpt-4.1", "name": "GPT-4.1"}, {"id": "gpt-4.1-mini", "name": "GPT-4.1 Mini"}]
+PROMPTS = [{"id": "a", "name": "A", "prompt": "You are coach A."}, {"id": "b", "name": "B", "prompt": "You are coach B."}]
+SCENARIOS = [
+    {"id": "transitions", "turns": ["my class falls apart during transitions", "what should I try first?"]},
+    {"id": "questioning", "turns": ["students never answer my questions"]},
+]
+
+
+@pytest.fixture
+def scenarios(tmp_path, monkeypatch):
+    """Scenarios on a temp database, with model calls going to the mock."""
+    server, base_url = start_server(ttft=0.0, token_interval=0.0, tokens=5)
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    monkeypatch.setattr(llm_client, "_client", None)
+    db_path = arena_db.DB_PATH
+    arena_db.set_db_path(str(tmp_path / "nisa_arena.db"))
+    arena_db.init_db()
+    path = tmp_path / "scenarios.json"
+    path.write_text(json.dumps(SCENARIOS))
+    yield batch_eval.load_scenarios(str(path))
+    arena_db.set_db_path(db_path)
+    server.shutdown()
+
+
+def count(table: str) -> int:
+    return arena_db.connection().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_run_batch_saves_each_conversation_once(scenarios):
+    configs = batch_eval.eval_configs(MODELS, PROMPTS)
+    run_id = arena_db.start_eval_run("scenarios.json")
+    results = batch_eval.run_batch(scenarios, configs, workers=4, max_tokens=50, run_id=run_id, seed=0)
+
+    assert len(results) == len(scenarios) * len(configs)
+    assert all(r["error"] is None for r in results)
+    assert count('eval_conversations') == 8
+    # One row per user turn per conversation: 2 turns + 1 turn, for 4 configs
+    assert count('eval_turns') == 4 * 3
+    # Every two of the 4 configs, per scenario
+    assert count('eval_pairs') == 2 * 6
+    # The view pairs turns back up the way votes store them
+    assert count('eval_pair_turns') == 6 * 2 + 6 * 1
+
+
+def test_failed_conversation_is_left_out_of_pairs(scenarios, monkeypatch):
+    configs = batch_eval.eval_configs(MODELS, PROMPTS)
+    failing = configs[-1]
+    stream = batch_eval.stream_chat_completion
+
+    def flaky(model, messages, *args, **kwargs):
+        if model == failing["model"]["id"] and messages[0]["content"] == failing["prompt"]["prompt"]:
+            raise CompletionError("rate limited")
+        return stream(model, messages, *args, **kwargs)
+
+    monkeypatch.setattr(batch_eval, "stream_chat_completion", flaky)
+    run_id = arena_db.start_eval_run("scenarios.json")
+    results = batch_eval.run_batch(scenarios, configs, workers=4, max_tokens=50, run_id=run_id, seed=0)
+
+    assert sum(1 for r in results if r["error"] is not None) == len(scenarios)
+    assert count('eval_conversations') == 2 * 3
+    # Every two of the 3 configs that finished, per scenario
+    assert count('eval_pairs') == 2 * 3
+    with arena_db.transaction() as conn:
+        failing_id = arena_db.config_id(conn, failing)
+    paired = arena_db.connection().execute('''
+        SELECT COUNT(*) FROM eval_pairs p
+        JOIN eval_conversations a ON a.id = p.conversation_a
+        JOIN eval_conversations b ON b.id = p.conversation_b
+        WHERE ? IN (a.config, b.config)
+    ''', (failing_id,)).fetchone()[0]
+    assert paired == 0
+
+
+def test_pair_transcripts_skips_errors():
+    results = [{"config": i, "error": None if i != 1 else "boom"} for i in range(4)]
+    pairs = batch_eval.pair_transcripts(results, random.Random(0))
+    assert len(pairs) == 3
+    assert all(1 not in (left["config"], right["config"]) for left, right in pairs)
@@ -0,0 +1,46 @@
+"""
+formatting.StreamingTagFormatter against the one-shot format_response_with_tags.
+
+Usage: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import StreamingTagFormatter, format_response_with_tags
+
+REPLIES = [
+    "<innermonologue>  think hard \n</innermonologue>\n<output>\n hi coach </output>",
+    "<InnerMonologue>mixed case</InnerMonologue><OUTPUT>shouting</OUTPUT>",
+    "no tags at all, just a < b and a > b",
+    "<output>unclosed output",
+    "<innermonologue>nested <output>inside</output></innermonologue>",
+    "",
+]
+
+
+def stream(reply: str, size: int) -> StreamingTagFormatter:
+    formatter = StreamingTagFormatter()
+    for i in range(0, len(reply), size):
+        formatter.feed(reply[i:i + size])
+    return formatter
+
+
+@pytest.mark.parametrize("reply", REPLIES)
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_streamed_matches_one_shot(reply, size):
+    formatter = stream(reply, size)
+    assert formatter.finish() == format_response_with_tags(reply)
+    assert formatter.raw.getvalue() == reply
+
+
+def test_partial_closing_tag_is_held_back():
+    formatter = StreamingTagFormatter()
+    formatter.feed("<output>hi</outp")
+    assert "</outp" not in str(formatter)
+    formatter.feed("ut>")
+    assert formatter.finish() == format_response_with_tags("<output>hi</output>")
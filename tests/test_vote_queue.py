@@ -0,0 +1,106 @@
+"""
+vote_queue.VoteWriter spill-log replay and dedupe on a throwaway database.
+
+Usage: python -m pytest tests
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arena_db
+from vote_queue import VoteWriter
+
+LEFT = {"model": {"id": "gpt-4.1", "name": "GPT-4.1"}, "prompt": {"id": "a", "name": "A", "prompt": "You are coach A."}}
+RIGHT = {"model": {"id": "gpt-4.1-mini", "name": "GPT-4.1 Mini"}, "prompt": {"id": "a", "name": "A", "prompt": "You are coach A."}}
+CONVERSATION = [{"user": "hi", "left": "hello", "right": "hey"}]
+
+
+@pytest.fixture
+def spill_base(tmp_path):
+    """Spill log base path next to a temp database."""
+    db_path = arena_db.DB_PATH
+    arena_db.set_db_path(str(tmp_path / "nisa_arena.db"))
+    arena_db.init_db()
+    yield str(tmp_path / "nisa_arena.db.votes-spill")
+    arena_db.set_db_path(db_path)
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def record(seq: int, with_id: bool = True) -> dict:
+    vote = {"seq": seq, "ts": "2026-01-01T00:00:00", "conversation": CONVERSATION,
+            "left_config": LEFT, "right_config": RIGHT, "winner": "left"}
+    if with_id:
+        vote["id"] = uuid.uuid4().hex
+    return vote
+
+
+def write_spill(path: str, records: list) -> None:
+    with open(path, "w") as f:
+        for vote in records:
+            f.write(json.dumps(vote) + "\n")
+
+
+def vote_count() -> int:
+    return arena_db.connection().execute('SELECT COUNT(*) FROM votes').fetchone()[0]
+
+
+def writer_threads() -> int:
+    return sum(1 for thread in threading.enumerate() if thread.name == "vote-writer")
+
+
+def test_replays_every_spill_log_once(spill_base):
+    first, second = [record(seq) for seq in (1, 2, 3)], [record(seq) for seq in (1, 2)]
+    # A vote the first process committed and the second replayed before dying
+    second.append(first[0])
+    dead_logs = [f"{spill_base}.{dead_pid()}", f"{spill_base}.{dead_pid()}"]
+    write_spill(dead_logs[0], first)
+    write_spill(dead_logs[1], second)
+    # Legacy log without ids: seq 1 was committed before the crash
+    write_spill(spill_base, [record(seq, with_id=False) for seq in (1, 2, 3)])
+    with arena_db.transaction(immediate=True) as conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('vote_spill_seq', 1)")
+
+    writer = VoteWriter(spill_base=spill_base)
+    writer.start()
+    assert writer_threads() == 1
+    writer.submit(CONVERSATION, LEFT, RIGHT, "right")
+    started = time.monotonic()
+    writer.stop()
+    assert time.monotonic() - started < 2
+    assert writer_threads() == 0
+
+    # 3 + 2 unique replayed, 2 legacy past the committed seq, 1 submitted
+    assert vote_count() == 8
+    spill_ids = [row[0] for row in arena_db.connection().execute('SELECT spill_id FROM votes WHERE spill_id IS NOT NULL')]
+    assert len(spill_ids) == len(set(spill_ids)) == 6
+    assert not any(os.path.exists(path) for path in dead_logs)
+    assert os.path.getsize(writer.spill_path) == 0
+
+
+def test_replay_skips_votes_committed_before_a_crash(spill_base):
+    writer = VoteWriter(spill_base=spill_base)
+    committed, uncommitted = record(1), record(2)
+    write_spill(writer.spill_path, [committed, uncommitted])
+    # The writer got the first vote in but crashed before truncating the log
+    with arena_db.transaction(immediate=True) as conn:
+        arena_db.insert_vote(conn, CONVERSATION, LEFT, RIGHT, "left", committed["ts"], spill_id=committed["id"])
+
+    writer.start()
+    writer.stop()
+    assert vote_count() == 2
+    assert os.path.getsize(writer.spill_path) == 0
+    assert writer_threads() == 0
@@ -0,0 +1,249 @@
+import os
+import glob
+import json
+import uuid
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Optional
+
+import arena_db
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+VOTE_QUEUE_SIZE = 1000
+# Votes committed together in one transaction
+GROUP_COMMIT_MAX = 64
+# How long the writer waits for more votes to join a batch
+GROUP_COMMIT_LINGER = 0.02
+RETRY_DELAY = 1.0
+SHUTDOWN_TIMEOUT = 10.0
+
+# -----------------------------------------------------------------------------
+# Write-behind vote queue
+# -----------------------------------------------------------------------------
+
+class VoteWriter:
+    """Records votes on a background thread with group commit.
+
+    submit() appends the vote to this process's spill log next to the
+    database and puts it on a bounded queue, then returns; it never waits
+    on SQLite locks or fsync. The writer thread commits whatever has queued
+    up in one transaction. Every vote carries a random id, stored with it
+    as votes.spill_id, and a vote whose id is already there is skipped. On
+    start the spill logs of every process sharing the database are
+    replayed, so votes that were enqueued but not committed survive an app
+    crash, and replaying votes that did get in is harmless. Logs of
+    processes that have exited are then removed; our own is truncated
+    whenever the writer has caught up.
+
+    The spill log is flushed to the OS but not fsynced: it survives the
+    process dying, not the machine losing power.
+    """
+
+    def __init__(self, spill_base: Optional[str] = None, maxsize: int = VOTE_QUEUE_SIZE,
+                 batch_size: int = GROUP_COMMIT_MAX, linger: float = GROUP_COMMIT_LINGER):
+        # One log per process (<base>.<pid>), so processes sharing the
+        # database never append to or truncate each other's
+        self.spill_base = spill_base or arena_db.DB_PATH + ".votes-spill"
+        self.spill_path = f"{self.spill_base}.{os.getpid()}"
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=maxsize)
+        self._log_lock = threading.Lock()
+        self._seq = 0
+        self._committed = 0
+        self._thread: Optional[threading.Thread] = None
+
+    # -- lifecycle -------------------------------------------------------------
+
+    def start(self) -> None:
+        """Replay the spill logs, then start the writer thread."""
+        for path in sorted(glob.glob(glob.escape(self.spill_base) + "*")):
+            self._replay(path)
+
+        self._thread = threading.Thread(target=self._run, name="vote-writer", daemon=True)
+        self._thread.start()
+
+    def _replay(self, path: str) -> None:
+        records = self._read_spill(path)
+        if path == self.spill_base:
+            # Written before votes had ids; a meta counter marks progress
+            committed = self._legacy_committed_seq()
+            records = [record for record in records if record["seq"] > committed]
+        if records:
+            logger.info("Replaying %d votes from %s", len(records), path)
+            self._write(records)
+        if path == self.spill_path:
+            # Left by an earlier process with our pid (a restarted container)
+            open(path, "w").close()
+        elif not spill_owner_alive(path, self.spill_base):
+            os.remove(path)
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Flush everything queued so far and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # -- producer side ---------------------------------------------------------
+
+    def submit(self, conversation: List[Dict], left_config: Dict, right_config: Dict, winner: str) -> None:
+        """Log and enqueue a vote; returns without touching the database."""
+        if winner not in arena_db.WINNERS:
+            raise ValueError(f"Unknown winner: {winner}")
+        with self._log_lock:
+            self._seq += 1
+            record = {
+                "id": uuid.uuid4().hex,
+                "seq": self._seq,
+                "ts": datetime.utcnow().isoformat(),
+                "conversation": list(conversation),
+                # Prompt id and version only; the text is in prompt_versions
+                "left_config": arena_db.config_ref(left_config),
+                "right_config": arena_db.config_ref(right_config),
+                "winner": winner,
+            }
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            # Enqueued under the lock so the writer sees votes in seq order,
+            # which is what lets one committed seq number say whether the
+            # log can be truncated. A full queue blocks here (backpressure)
+            # until the writer catches up.
+            self._queue.put(record)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # -- writer side -----------------------------------------------------------
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            while True:
+                try:
+                    self._write(batch)
+                    break
+                except sqlite3.OperationalError:
+                    # Locked or busy past the timeout; the votes are safe in the spill log
+                    logger.exception("Vote batch failed, retrying in %.1fs", RETRY_DELAY)
+                    time.sleep(RETRY_DELAY)
+                except Exception:
+                    # A malformed vote; write the rest one by one and drop only it
+                    for record in batch:
+                        try:
+                            self._write([record])
+                        except Exception:
+                            logger.exception("Dropping vote %s", record["seq"])
+                    break
+            self._committed = batch[-1]["seq"]
+            self._truncate_if_caught_up()
+
+    def _write(self, records: List[Dict]) -> None:
+        # The check and the insert share one write transaction, so two
+        # processes replaying the same log can't both record a vote
+        with arena_db.transaction(immediate=True) as conn:
+            for record in records:
+                spill_id = record.get("id")
+                if spill_id and conn.execute('SELECT 1 FROM votes WHERE spill_id = ?', (spill_id,)).fetchone():
+                    continue
+                arena_db.insert_vote(conn, record["conversation"], record["left_config"],
+                                     record["right_config"], record["winner"], record["ts"],
+                                     spill_id=spill_id)
+
+    def _legacy_committed_seq(self) -> int:
+        row = arena_db.connection().execute("SELECT value FROM meta WHERE key = 'vote_spill_seq'").fetchone()
+        return row[0] if row else 0
+
+    def _read_spill(self, path: str) -> List[Dict]:
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line torn by a crash mid-write; its submit never returned
+                    continue
+        return records
+
+    def _truncate_if_caught_up(self) -> None:
+        # A submitter blocked on a full queue holds the lock; skip this round
+        # rather than wait for it, since it is waiting for us
+        if not self._log_lock.acquire(blocking=False):
+            return
+        try:
+            if self._committed >= self._seq and os.path.exists(self.spill_path):
+                open(self.spill_path, "w").close()
+        finally:
+            self._log_lock.release()
+
+
+def spill_owner_alive(path: str, spill_base: str) -> bool:
+    """Whether the process that wrote a spill log may still be running."""
+    pid = path[len(spill_base) + 1:]
+    if not pid.isdigit():
+        return False
+    if os.name == "nt":
+        # No cheap liveness probe; keep the log (replaying it again is harmless)
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_writer: Optional[VoteWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_vote_writer() -> VoteWriter:
+    """Return the process-wide writer, starting it (and replaying) on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = VoteWriter()
+                writer.start()
+                _writer = writer
+    return _writer
+
+
+def submit_vote(conversation: List[Dict], left_config: Dict, right_config: Dict, winner: str) -> None:
+    """Record a vote without waiting for the database."""
+    get_vote_writer().submit(conversation, left_config, right_config, winner)
+
+
+@atexit.register
+def _flush_votes() -> None:
+    # Registered after arena_db's pool cleanup, so it runs before it
+    if _writer is not None:
+        _writer.stop()